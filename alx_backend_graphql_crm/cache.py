@@ -0,0 +1,43 @@
+"""
+Cache settings picked from the environment.
+
+The response cache's model versions (crm.cache) and the persisted query
+store (crm.documents) live in the default cache. Every worker must see the
+same one, or a write in one worker leaves stale responses in the others.
+``CRM_CACHE_BACKEND`` selects it:
+
+``locmem`` (the default, for development and tests)
+    Per process, so only correct with a single worker. Needs no server.
+
+``redis`` (production)
+    ``CRM_CACHE_LOCATION`` is the server URL (needs ``redis``).
+
+``memcached``
+    ``CRM_CACHE_LOCATION`` is ``host:port`` (needs ``pymemcache``).
+"""
+
+
+def cache_config(environ):
+    """
+    Returns the ``CACHES['default']`` entry described by ``environ``.
+    """
+    backend = environ.get('CRM_CACHE_BACKEND', 'locmem')
+
+    if backend == 'redis':
+        return {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': environ.get('CRM_CACHE_LOCATION', 'redis://127.0.0.1:6379/0'),
+        }
+
+    if backend == 'memcached':
+        return {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': environ.get('CRM_CACHE_LOCATION', '127.0.0.1:11211'),
+        }
+
+    if backend == 'locmem':
+        return {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+
+    raise ValueError(f"Unknown CRM_CACHE_BACKEND {backend!r}; use 'redis', 'memcached' or 'locmem'.")
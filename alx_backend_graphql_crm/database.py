@@ -0,0 +1,111 @@
+"""
+Database settings picked from the environment.
+
+``CRM_DB_ENGINE`` selects the profile:
+
+``sqlite`` (the default, for development)
+    ``CRM_DB_NAME`` is the database file. Connections use WAL journaling so
+    readers don't block the writer, wait up to ``CRM_DB_BUSY_TIMEOUT``
+    seconds for a lock instead of failing, and start transactions with
+    BEGIN IMMEDIATE so that concurrent writers queue on that timeout rather
+    than deadlocking when a read lock is upgraded.
+
+``postgresql`` (production)
+    ``CRM_DB_NAME``, ``CRM_DB_USER``, ``CRM_DB_PASSWORD``, ``CRM_DB_HOST`` and
+    ``CRM_DB_PORT`` locate the server. While ``CRM_DB_POOL_MAX_SIZE`` is
+    positive, each process keeps a psycopg connection pool of
+    ``CRM_DB_POOL_MIN_SIZE`` to ``CRM_DB_POOL_MAX_SIZE`` connections (this
+    needs ``psycopg[pool]``). With the pool disabled, connections are kept
+    for ``CRM_DB_CONN_MAX_AGE`` seconds and checked before being reused.
+
+Read replicas are described by ``replica_configs``. The test suite runs
+against either profile, e.g.
+``CRM_DB_ENGINE=postgresql python manage.py test``; ``tox`` runs both, as
+CI does.
+"""
+
+from pathlib import Path
+
+
+def _int(environ, name, default):
+    value = environ.get(name, default)
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got {value!r}.") from None
+
+
+def database_config(environ, base_dir):
+    """
+    Returns the ``DATABASES['default']`` entry described by ``environ``.
+    """
+    engine = environ.get('CRM_DB_ENGINE', 'sqlite')
+
+    if engine == 'sqlite':
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': environ.get('CRM_DB_NAME') or base_dir / 'db.sqlite3',
+            'OPTIONS': {
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+                'timeout': _int(environ, 'CRM_DB_BUSY_TIMEOUT', 20),
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+
+    if engine == 'postgresql':
+        config = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': environ.get('CRM_DB_NAME', 'crm'),
+            'USER': environ.get('CRM_DB_USER', ''),
+            'PASSWORD': environ.get('CRM_DB_PASSWORD', ''),
+            'HOST': environ.get('CRM_DB_HOST', ''),
+            'PORT': environ.get('CRM_DB_PORT', ''),
+            'OPTIONS': {},
+        }
+        max_size = _int(environ, 'CRM_DB_POOL_MAX_SIZE', 10)
+        if max_size > 0:
+            # the pool owns connections, so Django must not keep them itself
+            config['CONN_MAX_AGE'] = 0
+            config['OPTIONS']['pool'] = {
+                'min_size': min(_int(environ, 'CRM_DB_POOL_MIN_SIZE', 2), max_size),
+                'max_size': max_size,
+                'timeout': _int(environ, 'CRM_DB_POOL_TIMEOUT', 10),
+            }
+        else:
+            config['CONN_MAX_AGE'] = _int(environ, 'CRM_DB_CONN_MAX_AGE', 60)
+            config['CONN_HEALTH_CHECKS'] = True
+        return config
+
+    raise ValueError(f"Unknown CRM_DB_ENGINE {engine!r}; use 'sqlite' or 'postgresql'.")
+
+
+def replica_configs(environ, base_dir):
+    """
+    Returns ``alias -> DATABASES entry`` for the read replicas listed in
+    ``environ``: comma-separated files in ``CRM_DB_REPLICA_NAMES`` for
+    SQLite, hosts in ``CRM_DB_REPLICA_HOSTS`` for PostgreSQL. Each replica
+    otherwise shares the primary's settings, but its connections are
+    read-only.
+
+    A SQLite replica is a copy of the primary file, refreshed by hand, which
+    is enough to try the routing locally. It is opened with ``mode=ro`` and
+    none of the primary's journaling and locking setup, which is there for
+    writers. Test runs use the primary.
+    """
+    if environ.get('CRM_DB_ENGINE', 'sqlite') == 'sqlite':
+        setting, variable = 'CRM_DB_NAME', 'CRM_DB_REPLICA_NAMES'
+    else:
+        setting, variable = 'CRM_DB_HOST', 'CRM_DB_REPLICA_HOSTS'
+    values = [value.strip() for value in environ.get(variable, '').split(',') if value.strip()]
+
+    replicas = {}
+    for i, value in enumerate(values, 1):
+        config = database_config({**environ, setting: value}, base_dir)
+        if config['ENGINE'] == 'django.db.backends.sqlite3':
+            config['NAME'] = Path(config['NAME']).absolute().as_uri() + '?mode=ro'
+            config['OPTIONS'] = {}
+        else:
+            config['OPTIONS']['options'] = '-c default_transaction_read_only=on'
+        config['TEST'] = {'MIRROR': 'default'}
+        replicas[f'replica_{i}'] = config
+    return replicas
@@ -1,5 +1,5 @@
 import graphene
-from crm.schema import Query as CRMQuery, Mutation as CRMMutation
+from crm.schema import Query as CRMQuery, AsyncQuery as CRMAsyncQuery, Mutation as CRMMutation
 
 class Query(CRMQuery, graphene.ObjectType):
     hello = graphene.String(default_value="Hello, GraphQL!")
@@ -10,4 +10,16 @@ class Query(CRMQuery, graphene.ObjectType):
 class Mutation(CRMMutation, graphene.ObjectType):
     pass
 
+class AsyncQuery(CRMAsyncQuery, graphene.ObjectType):
+    hello = graphene.String(default_value="Hello, GraphQL!")
+    
+    class Meta:
+        name = "Query"
+    
+    async def resolve_hello(self, info):
+        return "Hello, GraphQL!"
+
 schema = graphene.Schema(query=Query, mutation=Mutation)
+
+# Served by the async view under ASGI; mutations still run synchronously
+async_schema = graphene.Schema(query=AsyncQuery, mutation=Mutation)
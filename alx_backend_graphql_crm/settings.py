@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .cache import cache_config
+from .database import database_config, replica_configs
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -76,11 +80,30 @@ WSGI_APPLICATION = 'alx_backend_graphql_crm.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite by default; see alx_backend_graphql_crm/database.py for the
+# PostgreSQL profile and the CRM_DB_* variables
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(os.environ, BASE_DIR),
+    **replica_configs(os.environ, BASE_DIR),
+}
+
+# GraphQL query operations read from one of CRM_DB_REPLICAS. Mutations, and
+# queries from a client that sent a mutation in the last CRM_DB_STICKY_SECONDS
+# (remembered with the CRM_DB_STICKY_COOKIE cookie), use the primary.
+DATABASE_ROUTERS = ['crm.routers.ReplicaRouter']
+CRM_DB_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+CRM_DB_STICKY_SECONDS = 5
+CRM_DB_STICKY_COOKIE = 'crm_primary'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# Per process unless CRM_CACHE_BACKEND selects a server shared between workers
+# (redis or memcached, which deployments with several workers need); see
+# alx_backend_graphql_crm/cache.py.
+CACHES = {
+    'default': cache_config(os.environ),
 }
 
 
@@ -127,9 +150,43 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # GraphQL
 GRAPHENE = {
-    'SCHEMA': 'alx_backend_graphql_crm.schema.schema'
+    'SCHEMA': 'alx_backend_graphql_crm.schema.schema',
+    'MIDDLEWARE': ['crm.middleware.ResolverProfilingMiddleware'],
 }
 
+# Parsed and validated documents kept per process by the /graphql view
+CRM_GRAPHQL_DOCUMENT_CACHE_SIZE = 512
+
+# Most operations accepted in one batched (JSON array) request to /graphql
+CRM_GRAPHQL_MAX_BATCH_SIZE = 10
+
+# Automatic persisted queries: cache alias and how long hashes are kept (seconds)
+CRM_PERSISTED_QUERY_CACHE = 'default'
+CRM_PERSISTED_QUERY_TIMEOUT = 60 * 60 * 24
+
+# Operations deeper or costlier than this are rejected before execution. Plain
+# list fields are assumed to return CRM_GRAPHQL_LIST_SIZE items when costing.
+# The default cost admits an unpaginated connection with two levels of nested
+# lists (e.g. allCustomers { edges { node { orders { products { name } } } } }),
+# which clients sent before the limit existed; a third level needs first: N.
+CRM_GRAPHQL_MAX_DEPTH = 10
+CRM_GRAPHQL_MAX_COST = 50000
+CRM_GRAPHQL_LIST_SIZE = 20
+
+# Response cache for read-only queries. Disabled while the timeout is 0; only
+# operations whose root fields are all listed below are cached. Queries read
+# from a replica are served cached responses but never store their own, since
+# the replica may not have caught up with the writes that invalidated them.
+CRM_RESPONSE_CACHE_ALIAS = 'default'
+CRM_RESPONSE_CACHE_TIMEOUT = 0
+CRM_RESPONSE_CACHE_FIELDS = ['allProducts', 'productById', 'customerById']
+
+# Distinct operation names tracked by /metrics; the rest are counted as <other>
+CRM_METRICS_MAX_OPERATIONS = 200
+
+# Share of operations whose resolvers are timed by crm.middleware (0 to 1)
+CRM_RESOLVER_PROFILE_RATE = 0
+
 # Cron Jobs
 CRONJOBS = [
     ('*/5 * * * *', 'crm.cron.log_crm_heartbeat'),
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+"""
+Runs a fixed set of GraphQL operations against a synthetic dataset and
+reports their latency percentiles, SQL queries and peak memory as JSON.
+
+Builds a scratch SQLite database (it is deleted first), seeds it with the
+requested number of rows from a fixed random seed, then sends every
+operation through Django's test client:
+
+    python benchmarks/graphql_api.py --orders 20000 --output before.json
+    python benchmarks/graphql_api.py --orders 20000 --compare before.json
+
+Runs with the same arguments and seed use the same data, so their results
+can be compared across commits.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+from pathlib import Path
+
+import django
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
+
+BATCH_SIZE = 5000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--customers', type=int, default=2_000)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--orders', type=int, default=10_000)
+    parser.add_argument('--items-per-order', type=int, default=3)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--database', default='/tmp/crm_api_benchmark.sqlite3')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the JSON report here as well as to stdout.")
+    parser.add_argument('--compare', help="A previous JSON report to print the changes against.")
+    return parser.parse_args()
+
+
+def setup(database):
+    from django.conf import settings
+
+    if os.path.exists(database):
+        os.remove(database)
+    settings.DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': database,
+    }
+    # the test client's host, and no per-query logging skewing memory use
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+    settings.DEBUG = False
+    django.setup()
+
+
+def seed(args, rng):
+    from crm.models import Customer, Order, OrderItem, Product
+
+    Customer.objects.bulk_create(
+        (Customer(name=f'Customer {i}', email=f'customer{i}@example.com') for i in range(args.customers)),
+        batch_size=BATCH_SIZE,
+    )
+    Product.objects.bulk_create(
+        (
+            Product(name=f'Product {i}', price=Decimal(rng.randint(100, 100_000)) / 100, stock=10 ** 9)
+            for i in range(args.products)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    customer_ids = list(Customer.objects.values_list('pk', flat=True))
+    prices = dict(Product.objects.values_list('pk', 'price'))
+    product_ids = sorted(prices)
+
+    for start in range(0, args.orders, BATCH_SIZE):
+        orders = []
+        items = []
+        for _ in range(min(BATCH_SIZE, args.orders - start)):
+            order = Order(customer_id=rng.choice(customer_ids))
+            order.created_items = [
+                OrderItem(order=order, product_id=product_id, quantity=rng.randint(1, 5), unit_price=prices[product_id])
+                for product_id in rng.sample(product_ids, min(args.items_per_order, len(product_ids)))
+            ]
+            order.total_amount = sum(item.unit_price * item.quantity for item in order.created_items)
+            orders.append(order)
+        Order.objects.bulk_create(orders, batch_size=BATCH_SIZE)
+        OrderItem.objects.bulk_create(
+            (item for order in orders for item in order.created_items),
+            batch_size=BATCH_SIZE,
+        )
+    return customer_ids, product_ids
+
+
+def operations(args, rng, customer_ids, product_ids):
+    """
+    Returns ``name -> callable`` producing the (query, variables) to send.
+    """
+    from crm.models import Order
+
+    order_ids = list(Order.objects.values_list('pk', flat=True))
+    new_customers = iter(range(10 ** 9))
+
+    def all_orders():
+        return '''
+            query AllOrders($first: Int) {
+                allOrders(first: $first) {
+                    totalCount
+                    edges { node { id status totalAmount customer { name email } } }
+                }
+            }
+        ''', {'first': args.page_size}
+
+    def order_by_id():
+        return '''
+            query OrderById($id: Int!) {
+                orderById(id: $id) {
+                    id status totalAmount
+                    customer { email }
+                    items { quantity product { name price } }
+                }
+            }
+        ''', {'id': rng.choice(order_ids)}
+
+    def create_order():
+        return '''
+            mutation CreateOrder($input: OrderInput!) {
+                createOrder(input: $input) { order { id totalAmount } }
+            }
+        ''', {'input': {
+            'customerId': rng.choice(customer_ids),
+            'items': [
+                {'productId': product_id, 'quantity': rng.randint(1, 3)}
+                for product_id in rng.sample(product_ids, min(2, len(product_ids)))
+            ],
+        }}
+
+    def bulk_create_customers():
+        batch = [next(new_customers) for _ in range(50)]
+        return '''
+            mutation BulkCreateCustomers($input: [CustomerInput]!) {
+                bulkCreateCustomers(input: $input) { customers { id } errors }
+            }
+        ''', {'input': [
+            {'name': f'Benchmark {i}', 'email': f'benchmark{i}@example.com', 'phone': '+1234567890'}
+            for i in batch
+        ]}
+
+    return {
+        'allOrders': all_orders,
+        'orderById': order_by_id,
+        'createOrder': create_order,
+        'bulkCreateCustomers': bulk_create_customers,
+    }
+
+
+def send(client, query, variables):
+    response = client.post(
+        '/graphql',
+        json.dumps({'query': query, 'variables': variables}),
+        content_type='application/json',
+    )
+    body = json.loads(response.content)
+    if response.status_code != 200 or body.get('errors'):
+        raise SystemExit(f'Operation failed ({response.status_code}): {body}')
+    return body
+
+
+def percentile(timings, percent):
+    ordered = sorted(timings)
+    rank = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def measure(client, build, iterations, warmup):
+    from django.db import connection
+    from crm.metrics import QueryCounter
+
+    for _ in range(warmup):
+        send(client, *build())
+
+    timings = []
+    queries = []
+    for _ in range(iterations):
+        query, variables = build()
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            send(client, query, variables)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count)
+
+    # traced separately: tracemalloc slows everything down
+    tracemalloc.start()
+    send(client, *build())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'queries': round(statistics.fmean(queries), 2),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, path):
+    with open(path, encoding='utf-8') as previous_file:
+        previous = json.load(previous_file)
+    print(f"\nChanges against {previous['meta'].get('revision')} ({path}):", file=sys.stderr)
+    for name, current in report['operations'].items():
+        before = previous['operations'].get(name)
+        if before is None:
+            continue
+        changes = ', '.join(
+            f"{key} {before[key]} -> {current[key]}"
+            + (f" ({(current[key] - before[key]) / before[key]:+.0%})" if before[key] else '')
+            for key in ('p50_ms', 'p95_ms', 'queries', 'peak_memory_kb')
+        )
+        print(f'  {name}: {changes}', file=sys.stderr)
+
+
+def main():
+    args = parse_args()
+    setup(args.database)
+
+    from django.core.management import call_command
+    from django.test import Client
+
+    call_command('migrate', verbosity=0)
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    customer_ids, product_ids = seed(args, rng)
+    print(f'Seeded in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+
+    client = Client()
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'dataset': {
+                'customers': args.customers,
+                'products': args.products,
+                'orders': args.orders,
+                'items_per_order': args.items_per_order,
+                'seed': args.seed,
+            },
+            'iterations': args.iterations,
+        },
+        'operations': {},
+    }
+    for name, build in operations(args, rng, customer_ids, product_ids).items():
+        report['operations'][name] = measure(client, build, args.iterations, args.warmup)
+        print(f'{name}: {report["operations"][name]}', file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + '\n', encoding='utf-8')
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+Shows the query plans and timings of the order lookups covered by the
+indexes in crm migration 0003, before and after the migration is applied.
+
+Builds a scratch SQLite database (it is deleted first), migrates crm to 0002,
+seeds it, measures, migrates to 0003 and measures again:
+
+    python benchmarks/order_indexes.py --orders 1000000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import django
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--orders', type=int, default=1_000_000)
+    parser.add_argument('--customers', type=int, default=50_000)
+    parser.add_argument('--database', default='/tmp/crm_index_benchmark.sqlite3')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def setup(database):
+    from django.conf import settings
+
+    if os.path.exists(database):
+        os.remove(database)
+    settings.DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': database,
+    }
+    django.setup()
+
+
+def seed(customers, orders, rng):
+    """
+    Inserts rows with executemany so that order dates can be spread over two
+    years (Order.date_ordered is auto_now_add, which bulk_create would set).
+    """
+    from django.db import connection, transaction
+    from django.utils import timezone
+    from crm.models import Customer, Order
+
+    now = timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {Customer._meta.db_table} (name, email, date_created) VALUES (%s, %s, %s)',
+            [(f'Customer {i}', f'customer{i}@example.com', now) for i in range(customers)],
+        )
+        statuses = ['pending'] * 1 + ['delivered'] * 7 + ['cancelled'] * 2
+        batch = []
+        for _ in range(orders):
+            batch.append((
+                rng.randint(1, customers),
+                now - timedelta(seconds=rng.randint(0, 2 * 365 * 24 * 3600)),
+                rng.choice(statuses),
+            ))
+            if len(batch) == 50_000:
+                cursor.executemany(
+                    f'INSERT INTO {Order._meta.db_table} (customer_id, date_ordered, status) VALUES (%s, %s, %s)',
+                    batch,
+                )
+                batch = []
+        if batch:
+            cursor.executemany(
+                f'INSERT INTO {Order._meta.db_table} (customer_id, date_ordered, status) VALUES (%s, %s, %s)',
+                batch,
+            )
+    analyze()
+
+
+def analyze():
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def workloads(customers):
+    from django.utils import timezone
+    from crm.models import Order
+
+    week_ago = timezone.now() - timedelta(days=7)
+    year_ago = timezone.now() - timedelta(days=365)
+    # only the columns that exist at 0002/0003, whatever the current model has
+    columns = ('id', 'customer_id', 'date_ordered', 'status')
+    return {
+        'pendingOrdersLastWeek': lambda: Order.objects.filter(
+            status='pending', date_ordered__gte=week_ago,
+        ).values(*columns),
+        'latest delivered orders': lambda: Order.objects.filter(
+            status='delivered',
+        ).order_by('-date_ordered').values(*columns)[:100],
+        'customer active in last year': lambda: Order.objects.filter(
+            customer_id=customers // 2, date_ordered__gte=year_ago,
+        ).values(*columns),
+    }
+
+
+def measure(label, queries, repeat):
+    print(f'\n=== {label} ===')
+    for name, build in queries.items():
+        queryset = build()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(build())
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f'\n{name}: median {statistics.median(timings):.2f} ms over {repeat} runs')
+        for line in queryset.explain().splitlines():
+            print(f'    {line}')
+
+
+def main():
+    args = parse_args()
+    setup(args.database)
+
+    from django.core.management import call_command
+
+    call_command('migrate', 'crm', '0002', verbosity=0)
+
+    print(f'Seeding {args.customers} customers and {args.orders} orders...')
+    started = time.perf_counter()
+    seed(args.customers, args.orders, random.Random(args.seed))
+    print(f'Seeded in {time.perf_counter() - started:.1f}s')
+
+    queries = workloads(args.customers)
+    measure('before 0003 (primary and foreign key indexes only)', queries, args.repeat)
+
+    started = time.perf_counter()
+    call_command('migrate', 'crm', '0003', verbosity=0)
+    analyze()
+    print(f'\nBuilt indexes in {time.perf_counter() - started:.1f}s')
+
+    measure('after 0003', queries, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Opt-in response cache for read-only GraphQL queries.
+
+Only query operations whose root fields are all listed in
+``CRM_RESPONSE_CACHE_FIELDS`` are cached, and only while
+``CRM_RESPONSE_CACHE_TIMEOUT`` is positive. Entries are keyed by the query
+text, operation name and variables, plus a version token for every model the
+selection reads. Saving or deleting a row of one of those models replaces its
+token, which makes every entry that depended on it unreachable.
+"""
+
+import hashlib
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from graphene.utils.str_converters import to_snake_case
+from graphql import ExecutionResult, FragmentDefinitionNode, get_named_type
+
+from .optimizer import iter_field_nodes
+from .transactions import PendingWork, pending_on_commit
+
+
+# how long a cold key's lock is held, and how long others wait on it (seconds)
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+LOCK_POLL_INTERVAL = 0.05
+
+
+def _cache():
+    return caches[getattr(settings, 'CRM_RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def _version_key(model):
+    return f'crm:version:{model._meta.label_lower}'
+
+
+def _enabled():
+    return getattr(settings, 'CRM_RESPONSE_CACHE_TIMEOUT', 0) > 0
+
+
+def _bump(models):
+    if not _enabled():
+        return
+    _cache().set_many({_version_key(model): uuid.uuid4().hex for model in models}, timeout=None)
+
+
+class _PendingInvalidation(PendingWork):
+    """
+    The on_commit callback re-invalidating the models a transaction wrote.
+    """
+
+    def __init__(self):
+        self.models = set()
+
+    def run(self):
+        _bump(self.models)
+
+
+def invalidate(*models):
+    """
+    Drops cached responses that read any of ``models``. Inside a transaction
+    this happens again once it commits, so that a response cached from a
+    read taken before the commit does not survive it.
+
+    Each model is invalidated once per transaction (or savepoint), however
+    many rows of it are written, e.g. by a cascading delete. Nothing is
+    written while the response cache is disabled.
+    """
+    if not _enabled():
+        return
+    if not transaction.get_connection().in_atomic_block:
+        _bump(models)
+        return
+
+    pending = pending_on_commit(_PendingInvalidation)
+    new_models = set(models) - pending.models
+    if new_models:
+        _bump(new_models)
+        pending.models.update(new_models)
+
+
+def model_versions(models):
+    if not _enabled():
+        return []
+    cache = _cache()
+    keys = sorted(_version_key(model) for model in models)
+    versions = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    for key, token in missing.items():
+        # another process may have created the token first; use theirs
+        if not cache.add(key, token, timeout=None):
+            token = cache.get(key, token)
+        versions[key] = token
+    return [versions[key] for key in keys]
+
+
+def _collect_models(graphql_type, field_nodes, fragments, models):
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+    model = getattr(getattr(graphene_type, '_meta', None), 'model', None)
+    if model is not None:
+        models.add(model)
+
+    fields = getattr(graphql_type, 'fields', None)
+    if not fields:
+        return
+    for node in field_nodes:
+        for field_node in iter_field_nodes(node.selection_set, fragments):
+            name = field_node.name.value
+            if name not in fields:
+                continue
+
+            resolver = getattr(graphene_type, f'resolve_{to_snake_case(name)}', None)
+            hints = getattr(resolver, 'query_hints', None)
+            if hints is not None:
+                models.update(hints['models'])
+                for path in hints['select_related'] + hints['prefetch_related']:
+                    related = model
+                    for part in path.split('__'):
+                        related = related._meta.get_field(part).related_model
+                        models.add(related)
+
+            _collect_models(get_named_type(fields[name].type), [field_node], fragments, models)
+
+
+def response_cache_key(graphql_schema, document, operation, query, operation_name, variables):
+    """
+    Returns the cache key for executing ``operation``, or None when the
+    cache is disabled or the operation is not cacheable.
+    """
+    if not _enabled():
+        return None
+
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    cacheable = set(getattr(settings, 'CRM_RESPONSE_CACHE_FIELDS', ()))
+    root_fields = [node.name.value for node in iter_field_nodes(operation.selection_set, fragments)]
+    if not root_fields or not all(name in cacheable or name == '__typename' for name in root_fields):
+        return None
+
+    models = set()
+    _collect_models(graphql_schema.query_type, [operation], fragments, models)
+
+    payload = json.dumps(
+        [query, operation_name, variables or {}, model_versions(models)],
+        sort_keys=True,
+        default=str,
+    )
+    return 'crm:response:' + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_or_execute(key, execute, store=True):
+    """
+    Returns an ExecutionResult for ``key``, from the cache when possible and
+    by calling ``execute()`` otherwise. Results with errors are not cached,
+    and neither is anything while ``store`` is False.
+
+    Only one caller recomputes a cold key: the rest wait for its result (up
+    to LOCK_WAIT seconds) rather than all hitting the database at once.
+    """
+    cache = _cache()
+    data = cache.get(key)
+    if data is not None:
+        return ExecutionResult(data=data)
+    if not store:
+        return execute()
+
+    lock_key = f'{key}:lock'
+    if not cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            data = cache.get(key)
+            if data is not None:
+                return ExecutionResult(data=data)
+        return execute()
+
+    try:
+        result = execute()
+        if not result.errors and result.data is not None:
+            cache.set(key, result.data, timeout=getattr(settings, 'CRM_RESPONSE_CACHE_TIMEOUT', 0))
+        return result
+    finally:
+        cache.delete(lock_key)
@@ -1,80 +1,46 @@
-import os
 import json
+import urllib.error
 import urllib.request
-import urllib.parse
 from datetime import datetime
-from django.conf import settings
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+
+
+HEALTHZ_URL = "http://localhost:8000/healthz"
 
 
 def log_crm_heartbeat():
     """
     Logs a heartbeat message every 5 minutes to confirm the CRM application's health.
-    Also optionally queries the GraphQL hello field to verify the endpoint is responsive.
+    Also reads /healthz, which checks the database and schema and reports request
+    counts, so the log shows whether the web tier is up and serving.
     """
     timestamp = datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
-    heartbeat_message = f"{timestamp} CRM is alive\n"
+    lines = [f"{timestamp} CRM is alive\n"]
     
     log_file_path = "/tmp/crm_heartbeat_log.txt"
     
     try:
-        with open(log_file_path, "a") as log_file:
-            log_file.write(heartbeat_message)
-        
+        with urllib.request.urlopen(HEALTHZ_URL, timeout=5) as response:
+            health = json.loads(response.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        # 503 still carries the failing checks, a proxy in front may not
         try:
-            # Try using gql library first
-            try:
-                transport = RequestsHTTPTransport(url="http://localhost:8000/graphql")
-                client = Client(transport=transport, fetch_schema_from_transport=False)
-                
-                query = gql("""
-                    query {
-                        hello
-                    }
-                """)
-                
-                result = client.execute(query)
-                
-                if 'hello' in result:
-                    graphql_status = f"{timestamp} GraphQL endpoint responsive: {result['hello']}\n"
-                    with open(log_file_path, "a") as log_file:
-                        log_file.write(graphql_status)
-                else:
-                    error_message = f"{timestamp} GraphQL endpoint error: Invalid response format\n"
-                    with open(log_file_path, "a") as log_file:
-                        log_file.write(error_message)
-                        
-            except ImportError:
-                # Fallback to urllib if gql is not available
-                query = {
-                    "query": "{ hello }"
-                }
-                
-                data = json.dumps(query).encode('utf-8')
-                
-                req = urllib.request.Request(
-                    'http://localhost:8000/graphql',
-                    data=data,
-                    headers={'Content-Type': 'application/json'}
-                )
-                
-                with urllib.request.urlopen(req, timeout=5) as response:
-                    result = json.loads(response.read().decode('utf-8'))
-                    
-                    if 'data' in result and 'hello' in result['data']:
-                        graphql_status = f"{timestamp} GraphQL endpoint responsive: {result['data']['hello']}\n"
-                        with open(log_file_path, "a") as log_file:
-                            log_file.write(graphql_status)
-                    else:
-                        error_message = f"{timestamp} GraphQL endpoint error: Invalid response format\n"
-                        with open(log_file_path, "a") as log_file:
-                            log_file.write(error_message)
-                        
-        except Exception as graphql_error:
-            error_message = f"{timestamp} GraphQL endpoint error: {str(graphql_error)}\n"
-            with open(log_file_path, "a") as log_file:
-                log_file.write(error_message)
-                
+            health = json.loads(e.read().decode('utf-8') or '{}')
+        except ValueError:
+            health = None
+            lines.append(f"{timestamp} Health endpoint error: HTTP {e.code}\n")
+    except Exception as e:
+        health = None
+        lines.append(f"{timestamp} Health endpoint error: {str(e)}\n")
+    
+    if health is not None:
+        lines.append(
+            f"{timestamp} Health: {health.get('status')} "
+            f"(database: {health.get('database')}, schema: {health.get('schema')}, "
+            f"requests: {health.get('requests')}, errors: {health.get('errors')})\n"
+        )
+    
+    try:
+        with open(log_file_path, "a") as log_file:
+            log_file.writelines(lines)
     except Exception as e:
         print(f"Failed to write heartbeat log: {str(e)}")
@@ -19,44 +19,17 @@ else
     exit 1
 fi
 
-DELETED_COUNT=$(python manage.py shell -c "
-from django.utils import timezone
-from datetime import timedelta
-from crm.models import Customer, Order
+OUTPUT=$(python manage.py cleanup_inactive_customers 2>&1)
+STATUS=$?
+TIMESTAMP=$(date '+%Y-%m-%d %H:%M:%S')
 
-# Calculate date one year ago
-one_year_ago = timezone.now() - timedelta(days=365)
+while IFS= read -r line; do
+    echo "[$TIMESTAMP] $line" >> "$LOG_FILE"
+done <<< "$OUTPUT"
 
-# Find customers with no orders in the last year
-customers_to_delete = Customer.objects.filter(
-    orders__isnull=True
-).union(
-    Customer.objects.exclude(
-        orders__date_ordered__gte=one_year_ago
-    ).filter(
-        orders__date_ordered__lt=one_year_ago
-    )
-).distinct()
-
-# Count and delete
-count = customers_to_delete.count()
-customers_to_delete.delete()
-
-print(count)
-" 2>/dev/null)
-
-if [ $? -eq 0 ]; then
-    if [ -n "$DELETED_COUNT" ] && [ "$DELETED_COUNT" -ge 0 ]; then
-        TIMESTAMP=$(date '+%Y-%m-%d %H:%M:%S')
-        echo "[$TIMESTAMP] Deleted $DELETED_COUNT inactive customers" >> "$LOG_FILE"
-        echo "Customer cleanup completed. Deleted $DELETED_COUNT customers."
-    else
-        TIMESTAMP=$(date '+%Y-%m-%d %H:%M:%S')
-        echo "[$TIMESTAMP] Warning: Unable to determine deletion count" >> "$LOG_FILE"
-        echo "Customer cleanup executed but unable to determine deletion count."
-    fi
+if [ $STATUS -eq 0 ]; then
+    echo "Customer cleanup completed. $(echo "$OUTPUT" | tail -n 1)"
 else
-    TIMESTAMP=$(date '+%Y-%m-%d %H:%M:%S')
     echo "[$TIMESTAMP] Error: Failed to execute customer cleanup" >> "$LOG_FILE"
     echo "Error: Failed to execute customer cleanup script."
     exit 1
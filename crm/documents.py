@@ -0,0 +1,107 @@
+"""
+Caches for GraphQL documents sent to the /graphql endpoint.
+
+Clients send the same few dozen operations over and over, so the parsed and
+validated document is kept in an in-process LRU keyed by the sha256 of the
+query text. Automatic persisted queries (the Apollo ``persistedQuery``
+extension) let clients send only that hash once the server has seen the full
+text; the hash -> text mapping lives in the Django cache so every worker
+shares it.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from graphql import GraphQLError
+
+
+PERSISTED_QUERY_NOT_FOUND = 'PersistedQueryNotFound'
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+class DocumentCache:
+    """
+    Thread-safe LRU of ``key -> (document, validation_errors)``.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+document_cache = DocumentCache(getattr(settings, 'CRM_GRAPHQL_DOCUMENT_CACHE_SIZE', 512))
+
+
+def _persisted_query_cache():
+    return caches[getattr(settings, 'CRM_PERSISTED_QUERY_CACHE', 'default')]
+
+
+def resolve_persisted_query(query, extensions):
+    """
+    Applies the ``persistedQuery`` extension, returning the query text to run.
+
+    A hash without a query is looked up in the store; a hash with a query is
+    checked against it and remembered. Raises GraphQLError when the hash is
+    unknown or does not match, or the extensions are not objects.
+    """
+    if not extensions:
+        return query
+    if not isinstance(extensions, dict):
+        raise GraphQLError('Extensions must be an object.')
+    persisted = extensions.get('persistedQuery')
+    if not persisted:
+        return query
+    if not isinstance(persisted, dict):
+        raise GraphQLError('The persistedQuery extension must be an object.')
+
+    if persisted.get('version') != 1:
+        raise GraphQLError('Unsupported persisted query version.')
+    sha256_hash = persisted.get('sha256Hash')
+    if not isinstance(sha256_hash, str):
+        raise GraphQLError('Persisted query is missing its sha256Hash.')
+
+    store = _persisted_query_cache()
+    key = f'crm:apq:{sha256_hash}'
+    if not query:
+        query = store.get(key)
+        if query is None:
+            raise GraphQLError(
+                PERSISTED_QUERY_NOT_FOUND,
+                extensions={'code': 'PERSISTED_QUERY_NOT_FOUND'},
+            )
+        return query
+
+    if query_hash(query) != sha256_hash:
+        raise GraphQLError('Provided sha256Hash does not match query.')
+    store.set(key, query, timeout=getattr(settings, 'CRM_PERSISTED_QUERY_TIMEOUT', 60 * 60 * 24))
+    return query
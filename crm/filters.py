@@ -0,0 +1,124 @@
+"""
+FilterSets and orderings behind the arguments of the list queries.
+
+Every filter becomes a WHERE clause on an indexed column, and the
+``orderBy`` enums list the orderings that keyset pagination can page
+through (each value is a field name, prefixed with ``-`` for descending).
+"""
+
+import sys
+
+import django_filters
+import django_filters.constants
+import graphene
+from django import forms
+from graphene.utils.str_converters import to_camel_case
+from graphene_django.filter.utils import get_filtering_args_from_filterset
+from graphql import GraphQLError
+
+from .models import Customer, Product, Order
+
+
+class IntegerFilter(django_filters.NumberFilter):
+    # exposed as Int rather than Decimal
+    field_class = forms.IntegerField
+
+
+class PrefixFilter(django_filters.CharFilter):
+    """
+    Case-sensitive prefix match. The ``>= prefix AND < next prefix`` range
+    lets any b-tree index serve it, which LIKE 'prefix%' cannot do under
+    every database collation; startswith then rechecks the exact rule.
+    """
+
+    def filter(self, qs, value):
+        if value in django_filters.constants.EMPTY_VALUES:
+            return qs
+        lookups = {
+            f'{self.field_name}__gte': value,
+            f'{self.field_name}__startswith': value,
+        }
+        last = ord(value[-1]) + 1
+        if last == 0xD800:
+            # surrogates can't be encoded: the next character is U+E000
+            last = 0xE000
+        # nothing follows U+10FFFF, so such a prefix has no upper bound
+        if last <= sys.maxunicode:
+            lookups[f'{self.field_name}__lt'] = value[:-1] + chr(last)
+        return qs.filter(**lookups)
+
+
+class CustomerFilter(django_filters.FilterSet):
+    name_prefix = PrefixFilter(field_name='name')
+    email_prefix = PrefixFilter(field_name='email')
+
+    class Meta:
+        model = Customer
+        fields = []
+
+
+class ProductFilter(django_filters.FilterSet):
+    name_prefix = PrefixFilter(field_name='name')
+    min_price = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
+    max_price = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
+    in_stock = django_filters.BooleanFilter()
+
+    class Meta:
+        model = Product
+        fields = []
+
+
+class OrderFilter(django_filters.FilterSet):
+    status = django_filters.ChoiceFilter(choices=Order.STATUS_CHOICES)
+    customer = IntegerFilter(field_name='customer')
+    date_from = django_filters.IsoDateTimeFilter(field_name='date_ordered', lookup_expr='gte')
+    date_to = django_filters.IsoDateTimeFilter(field_name='date_ordered', lookup_expr='lt')
+
+    class Meta:
+        model = Order
+        fields = []
+
+
+class CustomerOrdering(graphene.Enum):
+    NAME_ASC = 'name'
+    NAME_DESC = '-name'
+    DATE_CREATED_ASC = 'date_created'
+    DATE_CREATED_DESC = '-date_created'
+
+
+class ProductOrdering(graphene.Enum):
+    NAME_ASC = 'name'
+    NAME_DESC = '-name'
+    PRICE_ASC = 'price'
+    PRICE_DESC = '-price'
+
+
+class OrderOrdering(graphene.Enum):
+    DATE_ORDERED_ASC = 'date_ordered'
+    DATE_ORDERED_DESC = '-date_ordered'
+
+
+def list_arguments(filterset_class, node_type, ordering):
+    """
+    Returns the arguments of a paginated, filtered and ordered list field.
+    """
+    return {
+        'first': graphene.Int(),
+        'after': graphene.String(),
+        'order_by': ordering(),
+        **get_filtering_args_from_filterset(filterset_class, node_type),
+    }
+
+
+def filter_queryset(filterset_class, queryset, filters):
+    """
+    Applies the filter arguments of a list field to ``queryset``. Raises
+    GraphQLError listing the invalid arguments.
+    """
+    filterset = filterset_class(data=filters, queryset=queryset)
+    if not filterset.is_valid():
+        messages = [
+            f"{to_camel_case(name)}: {' '.join(errors)}" for name, errors in filterset.form.errors.items()
+        ]
+        raise GraphQLError(f"Invalid filters: {'; '.join(messages)}")
+    return filterset.qs
@@ -0,0 +1,269 @@
+"""
+Per-request batching loaders used by the relationship resolvers in crm.schema.
+
+Resolvers run one object at a time, so naively following ``order.items`` or
+``item.product`` costs a query per object. A loader collects the keys of every
+sibling object it has been told about and resolves them all with a single
+``IN (...)`` query the first time any one of them is requested.
+
+The loaders live on the request, so the operations of a batched request share
+them until one of them writes. Queries executed on the event loop by the async
+view use AsyncLoaders instead, whose ``load`` returns an awaitable and which
+read with the async ORM.
+"""
+
+import asyncio
+from collections import defaultdict
+
+from .models import Customer, Order, Product, OrderItem
+
+
+class DataLoader:
+    """
+    Caches the results of ``batch_load_fn`` for the lifetime of one request.
+
+    ``batch_load_fn`` receives a list of keys and returns a dict mapping each
+    key to its value; keys missing from the dict resolve to ``default``.
+    """
+
+    def __init__(self, batch_load_fn, default=None):
+        self.batch_load_fn = batch_load_fn
+        self.default = default
+        self._cache = {}
+        self._queue = []
+
+    def queue(self, keys):
+        """
+        Registers keys that are likely to be loaded soon so that the next
+        cache miss fetches them in the same batch.
+        """
+        for key in keys:
+            if key is not None and key not in self._cache:
+                self._queue.append(key)
+
+    def load(self, key):
+        if key is None:
+            return self.default
+        if key not in self._cache:
+            self._dispatch([key])
+        return self._cache[key]
+
+    def load_many(self, keys):
+        keys = list(keys)
+        missing = [key for key in keys if key is not None and key not in self._cache]
+        if missing:
+            self._dispatch(missing)
+        return [self._cache[key] if key is not None else self.default for key in keys]
+
+    def prime(self, key, value):
+        self._cache.setdefault(key, value)
+
+    def clear(self, key=None):
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(key, None)
+
+    def _dispatch(self, keys):
+        batch = list(dict.fromkeys(self._queue + keys))
+        batch = [key for key in batch if key not in self._cache]
+        self._queue = []
+        results = self.batch_load_fn(batch)
+        for key in batch:
+            self._cache[key] = results.get(key, self.default)
+
+
+class AsyncDataLoader:
+    """
+    DataLoader for resolvers running on the event loop.
+
+    ``load`` returns an awaitable. Keys requested before the loop next gets
+    to run, e.g. by every item of a list, are fetched together with the
+    queued ones by awaiting ``batch_load_fn``.
+    """
+
+    def __init__(self, batch_load_fn, default=None):
+        self.batch_load_fn = batch_load_fn
+        self.default = default
+        # key -> future of its value
+        self._cache = {}
+        self._queue = []
+        self._batch = None
+        # the event loop only keeps weak references to running tasks
+        self._dispatches = set()
+
+    def queue(self, keys):
+        for key in keys:
+            if key is not None and key not in self._cache:
+                self._queue.append(key)
+
+    def load(self, key):
+        if key is None:
+            return self._resolved(self.default)
+        if key not in self._cache:
+            loop = asyncio.get_running_loop()
+            self._cache[key] = loop.create_future()
+            if self._batch is None:
+                self._batch = []
+                task = loop.create_task(self._dispatch())
+                self._dispatches.add(task)
+                task.add_done_callback(self._dispatches.discard)
+            self._batch.append(key)
+        return self._cache[key]
+
+    async def load_many(self, keys):
+        futures = [self.load(key) for key in keys]
+        return [await future for future in futures]
+
+    def prime(self, key, value):
+        if key not in self._cache:
+            self._cache[key] = self._resolved(value)
+
+    @staticmethod
+    def _resolved(value):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(value)
+        return future
+
+    async def _dispatch(self):
+        requested, self._batch = self._batch, None
+        queued = [key for key in self._queue if key not in self._cache]
+        self._queue = []
+        batch = list(dict.fromkeys(requested + queued))
+        for key in queued:
+            self._cache[key] = asyncio.get_running_loop().create_future()
+
+        try:
+            results = await self.batch_load_fn(batch)
+        except Exception as e:
+            for key in batch:
+                future = self._cache.pop(key)
+                # only the requested keys have someone waiting for them
+                if key in requested:
+                    future.set_exception(e)
+            return
+        for key in batch:
+            self._cache[key].set_result(results.get(key, self.default))
+
+
+def _group(rows, attribute):
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[getattr(row, attribute)].append(row)
+    return grouped
+
+
+class Loaders:
+    """
+    The set of loaders shared by every resolver in a single request.
+    """
+
+    loader_class = DataLoader
+
+    def __init__(self):
+        self.customer = self.loader_class(self._load_customers)
+        self.product = self.loader_class(self._load_products)
+        self.order_items = self.loader_class(self._load_order_items, default=[])
+        self.customer_orders = self.loader_class(self._load_customer_orders, default=[])
+        self._lookups = {}
+
+    def queue_orders(self, orders):
+        """
+        Tells the loaders about a page of orders so that their customers,
+        items and customers' orders are fetched together rather than once per
+        order.
+        """
+        self.order_items.queue(order.pk for order in orders)
+        self.customer.queue(order.customer_id for order in orders)
+        self.customer_orders.queue(order.customer_id for order in orders)
+
+    def lookup(self, info, plan, fetch, **arguments):
+        """
+        Returns ``fetch()`` for the field being resolved, calling it once per
+        request for the same field, ``arguments`` and optimizer ``plan``.
+        Operations batched into one request that need the same row share it,
+        along with everything prefetched for it, whether their selections
+        are spelled out, spread from fragments or toggled by directives.
+        """
+        key = (info.parent_type.name, info.field_name, tuple(sorted(arguments.items())), plan.key())
+        if key not in self._lookups:
+            self._lookups[key] = fetch()
+        return self._lookups[key]
+
+    @staticmethod
+    def _load_customers(ids):
+        return Customer.objects.in_bulk(ids)
+
+    @staticmethod
+    def _load_products(ids):
+        return Product.objects.in_bulk(ids)
+
+    def _load_order_items(self, order_ids):
+        items = list(OrderItem.objects.filter(order_id__in=order_ids).order_by('pk'))
+
+        product_ids = [item.product_id for item in items]
+        for item, product in zip(items, self.product.load_many(product_ids)):
+            item.product = product
+        return _group(items, 'order_id')
+
+    def _load_customer_orders(self, customer_ids):
+        orders = list(Order.objects.filter(customer_id__in=customer_ids).order_by('pk'))
+        # queue_orders would queue these customers again while they load
+        self.order_items.queue(order.pk for order in orders)
+        return _group(orders, 'customer_id')
+
+
+class AsyncLoaders(Loaders):
+    """
+    Loaders for resolvers running on the event loop, reading with the
+    async ORM. ``lookup`` is not used there.
+    """
+
+    loader_class = AsyncDataLoader
+
+    @staticmethod
+    async def _load_customers(ids):
+        return await Customer.objects.ain_bulk(ids)
+
+    @staticmethod
+    async def _load_products(ids):
+        return await Product.objects.ain_bulk(ids)
+
+    async def _load_order_items(self, order_ids):
+        items = [item async for item in OrderItem.objects.filter(order_id__in=order_ids).order_by('pk')]
+
+        product_ids = [item.product_id for item in items]
+        for item, product in zip(items, await self.product.load_many(product_ids)):
+            item.product = product
+        return _group(items, 'order_id')
+
+    async def _load_customer_orders(self, customer_ids):
+        orders = [order async for order in Order.objects.filter(customer_id__in=customer_ids).order_by('pk')]
+        self.order_items.queue(order.pk for order in orders)
+        return _group(orders, 'customer_id')
+
+
+def get_loaders(info):
+    """
+    Returns the loaders attached to the current request, creating them on
+    first use. Without a context object (e.g. a bare ``schema.execute``) a
+    fresh, unshared set is returned.
+    """
+    context = info.context
+    if context is None:
+        return Loaders()
+
+    loaders = getattr(context, 'crm_loaders', None)
+    if loaders is None:
+        loaders = Loaders()
+        setattr(context, 'crm_loaders', loaders)
+    return loaders
+
+
+def clear_loaders(context):
+    """
+    Drops the loaders attached to ``context``, so that operations run after
+    a write in the same request don't read what they cached before it.
+    """
+    if getattr(context, 'crm_loaders', None) is not None:
+        context.crm_loaders = None
@@ -0,0 +1,30 @@
+"""
+Recomputes the order rollup tables from the orders, e.g. after a bulk load
+or a queryset update() that bypassed their incremental maintenance:
+
+    python manage.py rebuild_order_summaries
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.summaries import BATCH_SIZE, rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild OrderDailySummary and CustomerOrderSummary from the orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Rollup rows per insert.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError("--batch-size must be positive.")
+
+        started = time.perf_counter()
+        daily_rows, customer_rows = rebuild(options['batch_size'])
+        self.stdout.write(
+            f"Rebuilt {daily_rows} daily and {customer_rows} customer summaries "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
@@ -0,0 +1,91 @@
+"""
+Logs a reminder for every pending order placed in the last seven days.
+
+Runs against the ORM directly rather than through the /graphql endpoint, so
+it works whether or not the web tier is up. The id of the last reminded
+order is kept in a state file, and later runs skip everything up to it:
+
+    python manage.py send_order_reminders
+"""
+
+import json
+import os
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.models import Order
+
+
+LOG_FILE = '/tmp/order_reminders_log.txt'
+STATE_FILE = '/tmp/crm_order_reminders_state.json'
+
+
+def read_high_water_mark(path):
+    try:
+        with open(path, encoding='utf-8') as state:
+            return json.load(state)['last_order_id']
+    except FileNotFoundError:
+        return 0
+    except (ValueError, KeyError, TypeError) as e:
+        raise CommandError(f"Unreadable reminder state in {path}: {e}")
+
+
+def write_high_water_mark(path, order_id):
+    # written aside and renamed so a crash never leaves a truncated file
+    partial = f'{path}.tmp'
+    with open(partial, 'w', encoding='utf-8') as state:
+        json.dump({'last_order_id': order_id}, state)
+    os.replace(partial, path)
+
+
+class Command(BaseCommand):
+    help = "Log reminders for pending orders from the last week that were not reminded yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log-file', default=LOG_FILE)
+        parser.add_argument('--state-file', default=STATE_FILE)
+        parser.add_argument('--batch-size', type=int, default=500, help="Reminders written per batch.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError("--batch-size must be positive.")
+
+        last_order_id = read_high_water_mark(options['state_file'])
+        orders = (
+            Order.objects.pending_last_week()
+            .filter(pk__gt=last_order_id)
+            .order_by('pk')
+            .values_list('pk', 'date_ordered', 'customer__name', 'customer__email')
+            .iterator(chunk_size=options['batch_size'])
+        )
+
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        reminded = 0
+        with open(options['log_file'], 'a', encoding='utf-8') as log:
+            batch = []
+            for order_id, date_ordered, name, email in orders:
+                batch.append(
+                    f"[{timestamp}] REMINDER: Order ID {order_id} - Customer: {name} ({email}) "
+                    f"- Ordered: {date_ordered.isoformat()}\n"
+                )
+                if len(batch) == options['batch_size']:
+                    reminded += self.flush(log, batch, order_id, options['state_file'])
+            if batch:
+                reminded += self.flush(log, batch, order_id, options['state_file'])
+            if not reminded:
+                log.write(f"[{timestamp}] No new pending orders found in the last 7 days\n")
+
+        self.stdout.write(f"Order reminders processed! {reminded} sent.")
+
+    @staticmethod
+    def flush(log, batch, last_order_id, state_file):
+        """
+        Writes a batch of reminders, then records how far they got.
+        """
+        log.writelines(batch)
+        log.flush()
+        write_high_water_mark(state_file, last_order_id)
+        count = len(batch)
+        batch.clear()
+        return count
@@ -0,0 +1,157 @@
+"""
+In-process request metrics for the GraphQL views.
+
+Every executed operation records its latency, whether it failed and how many
+SQL queries it ran, aggregated per operation name, along with the resolver
+timings of operations sampled by crm.middleware. Figures are kept per
+worker process and reset when it restarts; the /metrics view returns the
+current process's snapshot.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+
+# upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+ANONYMOUS_OPERATION = '<anonymous>'
+OTHER_OPERATIONS = '<other>'
+
+
+class QueryCounter:
+    """
+    Database execute wrapper counting the queries run, and their total
+    time, while it is installed with ``connection.execute_wrapper``.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+@asynccontextmanager
+async def count_queries_async(counter):
+    """
+    Installs ``counter`` from async code. The async ORM runs queries in
+    the thread used by ``sync_to_async``, whose connection is not the one
+    visible on the event loop, so the wrapper is entered and left there.
+    """
+    def enter():
+        wrapper = connection.execute_wrapper(counter)
+        wrapper.__enter__()
+        return wrapper
+
+    wrapper = await sync_to_async(enter)()
+    try:
+        yield counter
+    finally:
+        await sync_to_async(wrapper.__exit__)(None, None, None)
+
+
+class OperationStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.resolvers = {}
+
+    def add(self, duration_ms, queries, failed, resolvers=None):
+        self.requests += 1
+        self.errors += failed
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.queries += queries
+        self.max_queries = max(self.max_queries, queries)
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, duration_ms)] += 1
+        for path, field in (resolvers or {}).items():
+            totals = self.resolvers.setdefault(path, dict.fromkeys(field, 0))
+            for key, value in field.items():
+                totals[key] += value
+
+    def as_dict(self):
+        bounds = [str(bound) for bound in LATENCY_BUCKETS_MS] + ['+Inf']
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'latency_ms': {
+                'mean': round(self.total_ms / self.requests, 3) if self.requests else 0,
+                'max': round(self.max_ms, 3),
+                'buckets': dict(zip(bounds, self.buckets)),
+            },
+            'queries': {
+                'total': self.queries,
+                'mean': round(self.queries / self.requests, 3) if self.requests else 0,
+                'max': self.max_queries,
+            },
+            'resolvers': {
+                path: {key: round(value, 3) for key, value in totals.items()}
+                for path, totals in sorted(self.resolvers.items())
+            },
+        }
+
+
+class Metrics:
+    """
+    Thread-safe per-operation statistics. At most ``max_operations`` names
+    are tracked; the rest are counted together, so clients sending random
+    operation names cannot grow it without bound.
+    """
+
+    def __init__(self, max_operations):
+        self.max_operations = max_operations
+        self.started = time.time()
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation_name, duration, queries=0, failed=False, resolvers=None):
+        name = operation_name or ANONYMOUS_OPERATION
+        with self._lock:
+            stats = self._operations.get(name)
+            if stats is None:
+                if len(self._operations) >= self.max_operations:
+                    name = OTHER_OPERATIONS
+                stats = self._operations.setdefault(name, OperationStats())
+            stats.add(duration * 1000, queries, failed, resolvers)
+
+    def totals(self):
+        with self._lock:
+            return {
+                'uptime_seconds': round(time.time() - self.started, 1),
+                'requests': sum(stats.requests for stats in self._operations.values()),
+                'errors': sum(stats.errors for stats in self._operations.values()),
+            }
+
+    def snapshot(self):
+        totals = self.totals()
+        with self._lock:
+            totals['operations'] = {
+                name: stats.as_dict() for name, stats in sorted(self._operations.items())
+            }
+        return totals
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+            self.started = time.time()
+
+
+metrics = Metrics(getattr(settings, 'CRM_METRICS_MAX_OPERATIONS', 200))
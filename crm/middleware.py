@@ -0,0 +1,92 @@
+"""
+Graphene middleware that profiles resolvers.
+
+For a sampled share of operations (``CRM_RESOLVER_PROFILE_RATE``, 0 to 1)
+every resolved field records its wall time and the number and duration of
+SQL queries it ran, keyed by its path with list indexes dropped (e.g.
+``allOrders.edges.node.products``). The views add the totals to the
+operation's entry in crm.metrics and, when DEBUG is on, return them under
+``extensions.resolvers``. Unsampled operations skip straight to the
+resolver.
+
+Fields resolved by async resolvers are timed but their queries are not
+counted: they run in another thread and overlap with their siblings.
+"""
+
+import random
+import time
+from inspect import isawaitable
+
+from django.conf import settings
+from django.db import connection
+
+from .metrics import QueryCounter
+
+
+class ResolverProfile:
+    """
+    Per-field totals for one operation: ``path -> [calls, ms, queries, sql ms]``.
+    """
+
+    def __init__(self):
+        self.fields = {}
+
+    @classmethod
+    def sample(cls):
+        rate = getattr(settings, 'CRM_RESOLVER_PROFILE_RATE', 0)
+        if rate > 0 and random.random() < rate:
+            return cls()
+        return None
+
+    def add(self, path, duration, queries=0, sql_duration=0.0):
+        totals = self.fields.get(path)
+        if totals is None:
+            totals = self.fields[path] = [0, 0.0, 0, 0.0]
+        totals[0] += 1
+        totals[1] += duration * 1000
+        totals[2] += queries
+        totals[3] += sql_duration * 1000
+
+    def as_dict(self):
+        return {
+            path: {
+                'calls': calls,
+                'time_ms': round(duration, 3),
+                'queries': queries,
+                'sql_time_ms': round(sql_duration, 3),
+            }
+            for path, (calls, duration, queries, sql_duration) in self.fields.items()
+        }
+
+
+def _field_path(info):
+    return '.'.join(key for key in info.path.as_list() if isinstance(key, str))
+
+
+class ResolverProfilingMiddleware:
+    def resolve(self, next, root, info, **args):
+        profile = getattr(info.context, 'crm_profile', None)
+        if profile is None:
+            return next(root, info, **args)
+
+        path = _field_path(info)
+        queries = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            try:
+                result = next(root, info, **args)
+            except Exception:
+                profile.add(path, time.perf_counter() - started, queries.count, queries.duration)
+                raise
+
+        if isawaitable(result):
+            return self._await(result, profile, path, started)
+        profile.add(path, time.perf_counter() - started, queries.count, queries.duration)
+        return result
+
+    @staticmethod
+    async def _await(result, profile, path, started):
+        try:
+            return await result
+        finally:
+            profile.add(path, time.perf_counter() - started)
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:55
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def build_summaries(apps, schema_editor):
+    """
+    Fills the rollups from existing orders; the same aggregation as
+    crm.summaries.rebuild, against the historical models.
+    """
+    using = schema_editor.connection.alias
+    Order = apps.get_model('crm', 'Order')
+    OrderDailySummary = apps.get_model('crm', 'OrderDailySummary')
+    CustomerOrderSummary = apps.get_model('crm', 'CustomerOrderSummary')
+
+    revenue = Coalesce(
+        Sum(F('items__quantity') * F('items__product__price'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+        Decimal('0.00'),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+    daily = (
+        Order.objects.using(using).annotate(day=TruncDate('date_ordered'))
+        .values('day', 'status')
+        .annotate(order_count=Count('pk', distinct=True), revenue=revenue)
+        .order_by()
+    )
+    OrderDailySummary.objects.using(using).bulk_create((OrderDailySummary(**row) for row in daily), batch_size=1000)
+    customers = (
+        Order.objects.using(using).values('customer_id')
+        .annotate(order_count=Count('pk', distinct=True), revenue=revenue)
+        .order_by()
+    )
+    CustomerOrderSummary.objects.using(using).bulk_create((CustomerOrderSummary(**row) for row in customers), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_list_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerOrderSummary',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='order_summary', serialize=False, to='crm.customer')),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-revenue'], name='crm_customer_summary_rev_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderDailySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'status'), name='crm_daily_summary_day_status_uniq')],
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
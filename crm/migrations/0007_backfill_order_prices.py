@@ -0,0 +1,63 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:20
+
+from decimal import Decimal
+from django.db import migrations, transaction
+from django.db.models import DecimalField, F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+BATCH_SIZE = 10000
+
+
+def _batches(queryset, using):
+    """
+    Yields ``queryset`` in primary key ranges of BATCH_SIZE, each inside its
+    own transaction, so that large tables are not locked for the whole run.
+    """
+    last_pk = queryset.aggregate(last=Max('pk'))['last'] or 0
+    for start in range(0, last_pk, BATCH_SIZE):
+        with transaction.atomic(using=using):
+            yield queryset.filter(pk__gt=start, pk__lte=start + BATCH_SIZE)
+
+
+def backfill(apps, schema_editor):
+    """
+    Snapshots the current product price on every item, then stores each
+    order's total. Prices before this migration were not recorded, so the
+    current ones are the best available.
+    """
+    using = schema_editor.connection.alias
+    Product = apps.get_model('crm', 'Product')
+    Order = apps.get_model('crm', 'Order')
+    OrderItem = apps.get_model('crm', 'OrderItem')
+
+    price = Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1])
+    for batch in _batches(OrderItem.objects.using(using), using):
+        batch.filter(unit_price__isnull=True).update(unit_price=price)
+
+    line_totals = (
+        OrderItem.objects.filter(order=OuterRef('pk'))
+        .values('order')
+        .annotate(total=Sum(F('quantity') * F('unit_price')))
+        .values('total')
+    )
+    total = Coalesce(
+        Subquery(line_totals, output_field=DecimalField(max_digits=12, decimal_places=2)),
+        Value(Decimal('0.00')),
+    )
+    for batch in _batches(Order.objects.using(using), using):
+        batch.update(total_amount=total)
+
+
+class Migration(migrations.Migration):
+
+    # every batch commits on its own
+    atomic = False
+
+    dependencies = [
+        ('crm', '0006_order_prices'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
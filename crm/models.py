@@ -1,6 +1,25 @@
-from django.db import models
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, Exists, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+# products per reservation UPDATE; SQLite rejects the statement's OR and CASE
+# chains somewhere below 1000 products
+RESERVE_STOCK_BATCH_SIZE = 250
 
 # Create your models here.
+class CustomerQuerySet(models.QuerySet):
+    def inactive(self, cutoff):
+        """
+        Customers without any order placed at or after ``cutoff``, found with
+        a NOT EXISTS anti-join (customers who never ordered included).
+        """
+        recent_orders = Order.objects.filter(customer=OuterRef('pk'), date_ordered__gte=cutoff)
+        return self.filter(~Exists(recent_orders))
+
 class Customer(models.Model):
     name = models.CharField(max_length=100)
     email = models.EmailField(unique=True)
@@ -8,9 +27,59 @@ class Customer(models.Model):
     address = models.TextField(blank=True, null=True)
     date_created = models.DateTimeField(auto_now_add=True)
     
+    objects = CustomerQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # allCustomers name prefix search and orderings
+            models.Index(fields=['name'], name='crm_customer_name_idx'),
+            models.Index(fields=['date_created'], name='crm_customer_created_idx'),
+        ]
+    
     def __str__(self):
         return self.name
 
+class ProductQuerySet(models.QuerySet):
+    def reserve_stock(self, quantities):
+        """
+        Takes ``quantities`` ({product_id: quantity}) out of stock with
+        conditional UPDATEs of up to RESERVE_STOCK_BATCH_SIZE products each,
+        keeping ``in_stock`` in step. Each row is only updated if it still
+        holds enough stock when the database locks it, so concurrent orders
+        can neither oversell nor lose an update.
+
+        Returns False, changing nothing, unless every product had enough.
+        """
+        if not quantities:
+            return True
+        
+        items = list(quantities.items())
+        with transaction.atomic():
+            for start in range(0, len(items), RESERVE_STOCK_BATCH_SIZE):
+                if not self._reserve_batch(dict(items[start:start + RESERVE_STOCK_BATCH_SIZE])):
+                    transaction.set_rollback(True)
+                    return False
+        return True
+    
+    def _reserve_batch(self, quantities):
+        condition = Q()
+        for product_id, quantity in quantities.items():
+            condition |= Q(pk=product_id, stock__gte=quantity)
+        
+        updated = self.filter(condition).update(
+            stock=Case(
+                *[When(pk=product_id, then=F('stock') - quantity) for product_id, quantity in quantities.items()],
+                default=F('stock'),
+                output_field=models.PositiveIntegerField(),
+            ),
+            # compared against the stock before this update
+            in_stock=Case(
+                *[When(pk=product_id, stock__gt=quantity, then=Value(True)) for product_id, quantity in quantities.items()],
+                default=Value(False),
+            ),
+        )
+        return updated == len(quantities)
+
 class Product(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
@@ -18,9 +87,57 @@ class Product(models.Model):
     stock = models.PositiveIntegerField(default=0)
     in_stock = models.BooleanField(default=True)
     
+    objects = ProductQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # allProducts name prefix search, price ranges and orderings
+            models.Index(fields=['name'], name='crm_product_name_idx'),
+            models.Index(fields=['price'], name='crm_product_price_idx'),
+            models.Index(fields=['in_stock', 'price'], name='crm_product_stock_price_idx'),
+        ]
+    
     def __str__(self):
         return self.name
 
+class OrderQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        Annotates each order with ``order_total``, the sum of unit price *
+        quantity over its items, computed by the database in the same query.
+        Reads should use the stored ``total_amount``; this recomputes it.
+        """
+        line_total = F('items__quantity') * F('items__unit_price')
+        return self.annotate(
+            order_total=Coalesce(
+                Sum(line_total, output_field=DecimalField(max_digits=12, decimal_places=2)),
+                Value(Decimal('0.00')),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+    
+    def refresh_totals(self):
+        """
+        Recomputes ``total_amount`` from the items with a single UPDATE.
+        """
+        line_totals = (
+            OrderItem.objects.filter(order=OuterRef('pk'))
+            .values('order')
+            .annotate(total=Sum(F('quantity') * F('unit_price')))
+            .values('total')
+        )
+        return self.update(total_amount=Coalesce(
+            Subquery(line_totals, output_field=DecimalField(max_digits=12, decimal_places=2)),
+            Value(Decimal('0.00')),
+        ))
+    
+    def pending_last_week(self):
+        """
+        Pending orders placed in the last seven days, as served by the
+        ``pendingOrdersLastWeek`` query and used by the reminder job.
+        """
+        return self.filter(status='pending', date_ordered__gte=timezone.now() - timedelta(days=7))
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -30,18 +147,110 @@ class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='orders')
     date_ordered = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # sum of unit_price * quantity over the items, kept by create_orders and
+    # the OrderItem signals so that reading it needs no join
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    
+    objects = OrderQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # pendingOrdersLastWeek and other status filters over a date range
+            models.Index(fields=['status', 'date_ordered'], name='crm_order_status_date_idx'),
+            # a customer's orders by date, e.g. the inactive-customer cleanup
+            models.Index(fields=['customer', 'date_ordered'], name='crm_order_customer_date_idx'),
+            # allOrders date ranges and ordering by date
+            models.Index(fields=['date_ordered'], name='crm_order_date_idx'),
+            # pending orders are a small, hot subset; skipped where unsupported
+            models.Index(
+                fields=['date_ordered'],
+                condition=Q(status='pending'),
+                name='crm_order_pending_date_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"Order {self.id} - {self.customer.name}"
-    
-    @property
-    def total_amount(self):
-        return sum(item.product.price * item.quantity for item in self.items.all())
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
+    # the product's price when the order was placed
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
+    
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:
+            self.unit_price = self.product.price
+        super().save(*args, **kwargs)
+
+
+class SummaryQuerySet(models.QuerySet):
+    def add(self, deltas):
+        """
+        Adds ``deltas`` (``[(key, order_count, revenue)]``, ``key`` being a
+        dict of the unique fields) to the matching rows, creating missing
+        ones first. The increments happen in a single UPDATE, so concurrent
+        writers add up rather than overwrite each other.
+        """
+        if not deltas:
+            return
+        
+        with transaction.atomic():
+            self.bulk_create(
+                [self.model(**key, order_count=0, revenue=Decimal('0.00')) for key, _, _ in deltas],
+                ignore_conflicts=True,
+            )
+            condition = Q()
+            count_cases = []
+            revenue_cases = []
+            for key, order_count, revenue in deltas:
+                condition |= Q(**key)
+                count_cases.append(When(Q(**key), then=F('order_count') + order_count))
+                revenue_cases.append(When(Q(**key), then=F('revenue') + revenue))
+            self.filter(condition).update(
+                order_count=Case(*count_cases, default=F('order_count'), output_field=models.IntegerField()),
+                revenue=Case(*revenue_cases, default=F('revenue'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+            )
+
+class OrderDailySummary(models.Model):
+    """
+    Orders and revenue per day (in TIME_ZONE) and status, kept up to date
+    by crm.summaries.
+    """
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    
+    objects = SummaryQuerySet.as_manager()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'], name='crm_daily_summary_day_status_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.status}: {self.order_count} orders"
+
+class CustomerOrderSummary(models.Model):
+    """
+    Orders and revenue per customer, kept up to date by crm.summaries.
+    """
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True, related_name='order_summary')
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    
+    objects = SummaryQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # top customers by revenue
+            models.Index(fields=['-revenue'], name='crm_customer_summary_rev_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.customer_id}: {self.order_count} orders"
@@ -0,0 +1,257 @@
+"""
+Selection-set aware queryset optimization for the crm.schema resolvers.
+
+``optimize(queryset, info)`` looks at the fields the client actually asked for
+and applies the matching ``only()``, ``select_related()`` and
+``prefetch_related()`` calls, so a resolver fetches the columns and relations
+it needs up front instead of one lazy query per object.
+
+Fields backed by custom resolvers can describe what they need with
+``query_hints``::
+
+    @query_hints(prefetch_related=('items__product',))
+    def resolve_products(self, info):
+        ...
+"""
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql import FieldNode, FragmentSpreadNode, InlineFragmentNode, get_named_type
+
+
+def query_hints(only=(), select_related=(), prefetch_related=(), queryset=None, models=()):
+    """
+    Declares what a custom resolver reads from the database.
+
+    ``select_related`` and ``prefetch_related`` take Django lookup paths;
+    ``queryset`` is a callable applied to the queryset, e.g. to annotate it.
+    ``models`` lists any other models the result depends on, so that cached
+    responses are invalidated when they change.
+    """
+    def decorator(resolver):
+        resolver.query_hints = {
+            'only': tuple(only),
+            'select_related': tuple(select_related),
+            'prefetch_related': tuple(prefetch_related),
+            'queryset': queryset,
+            'models': tuple(models),
+        }
+        return resolver
+    return decorator
+
+
+def _get_field(model, name):
+    """
+    Returns ``model``'s field called ``name``, also finding reverse relations
+    by their accessor (e.g. ``orderitem_set``), which is the name GraphQL
+    fields and prefetch lookups use for them.
+    """
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        for relation in model._meta.related_objects:
+            if relation.get_accessor_name() == name:
+                return relation
+        raise
+
+
+class QueryPlan:
+    """
+    The columns and relations to load for one model. Related models are
+    nested plans, either joined (``select_related``) or fetched separately
+    (``prefetch_related``).
+    """
+
+    def __init__(self, model):
+        self.model = model
+        # None means every column; hint-driven relations load whole rows
+        self.only = set()
+        self.select_related = {}
+        self.prefetch_related = {}
+        self.queryset_hooks = []
+
+    def key(self):
+        """
+        Returns a hashable summary of the plan. Plans with equal keys load
+        the same rows, however the selections they came from were written.
+        """
+        return (
+            self.model._meta.label,
+            None if self.only is None else frozenset(self.only),
+            tuple(sorted((name, plan.key()) for name, plan in self.select_related.items())),
+            tuple(sorted((name, plan.key()) for name, plan in self.prefetch_related.items())),
+            tuple(self.queryset_hooks),
+        )
+
+    def load_all_fields(self):
+        self.only = None
+
+    def add_field(self, name):
+        if self.only is not None:
+            self.only.add(name)
+
+    def related_plan(self, name):
+        """
+        Returns the plan for relation ``name``, creating it on first use.
+        """
+        field = _get_field(self.model, name)
+        if field.many_to_one or (field.one_to_one and field.concrete):
+            self.add_field(name)
+            plans = self.select_related
+        else:
+            plans = self.prefetch_related
+        if name not in plans:
+            plans[name] = QueryPlan(field.related_model)
+        return plans[name]
+
+    def add_path(self, path):
+        plan = self
+        for name in path.split('__'):
+            plan = plan.related_plan(name)
+            plan.load_all_fields()
+        return plan
+
+    def only_paths(self, prefix=''):
+        if self.only is None:
+            return None
+        paths = [prefix + name for name in self.only]
+        paths.append(prefix + self.model._meta.pk.name)
+        # foreign key columns are cheap, resolvers and loaders read them, and
+        # prefetched rows need them to be matched back to their parent
+        paths += [
+            prefix + field.name
+            for field in self.model._meta.concrete_fields
+            if field.is_relation
+        ]
+        for name, plan in self.select_related.items():
+            nested = plan.only_paths(f'{prefix}{name}__')
+            if nested is None:
+                return None
+            paths += nested
+        return sorted(set(paths))
+
+    def select_related_paths(self, prefix=''):
+        paths = []
+        for name, plan in self.select_related.items():
+            paths.append(prefix + name)
+            paths += plan.select_related_paths(f'{prefix}{name}__')
+        return paths
+
+    def prefetches(self, prefix=''):
+        prefetches = []
+        for name, plan in self.prefetch_related.items():
+            queryset = plan.apply(plan.model._default_manager.all())
+            prefetches.append(Prefetch(prefix + name, queryset=queryset))
+        for name, plan in self.select_related.items():
+            prefetches += plan.prefetches(f'{prefix}{name}__')
+        return prefetches
+
+    def apply(self, queryset):
+        only = self.only_paths()
+        if only is not None:
+            queryset = queryset.only(*only)
+        select_related = self.select_related_paths()
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        prefetches = self.prefetches()
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        for hook in self.queryset_hooks:
+            queryset = hook(queryset)
+        return queryset
+
+
+def iter_field_nodes(selection_set, fragments, _expanding=frozenset()):
+    """
+    Yields the field nodes of ``selection_set``, expanding fragment spreads
+    and inline fragments. A fragment that spreads itself is not re-entered.
+    """
+    if selection_set is None:
+        return
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            yield selection
+        elif isinstance(selection, FragmentSpreadNode):
+            name = selection.name.value
+            fragment = fragments.get(name)
+            if fragment is not None and name not in _expanding:
+                yield from iter_field_nodes(fragment.selection_set, fragments, _expanding | {name})
+        elif isinstance(selection, InlineFragmentNode):
+            yield from iter_field_nodes(selection.selection_set, fragments, _expanding)
+
+
+def _unwrap_connection(graphql_type, field_nodes, fragments):
+    """
+    Steps through ``edges { node { ... } }`` so that connections are planned
+    from the selection on their nodes.
+    """
+    fields = getattr(graphql_type, 'fields', {})
+    if 'edges' not in fields or 'pageInfo' not in fields:
+        return graphql_type, field_nodes
+
+    edge_type = get_named_type(fields['edges'].type)
+    node_type = get_named_type(edge_type.fields['node'].type)
+    node_fields = []
+    for node in field_nodes:
+        for edges in iter_field_nodes(node.selection_set, fragments):
+            if edges.name.value != 'edges':
+                continue
+            node_fields += [
+                field for field in iter_field_nodes(edges.selection_set, fragments)
+                if field.name.value == 'node'
+            ]
+    return node_type, node_fields
+
+
+def _plan_selection(plan, graphql_type, field_nodes, fragments):
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+    for node in field_nodes:
+        for field_node in iter_field_nodes(node.selection_set, fragments):
+            name = field_node.name.value
+            if name.startswith('__') or name not in graphql_type.fields:
+                continue
+            snake_name = to_snake_case(name)
+
+            resolver = getattr(graphene_type, f'resolve_{snake_name}', None)
+            hints = getattr(resolver, 'query_hints', None)
+            if hints is not None:
+                for field in hints['only']:
+                    plan.add_field(field)
+                for path in hints['select_related'] + hints['prefetch_related']:
+                    plan.add_path(path)
+                if hints['queryset'] is not None and hints['queryset'] not in plan.queryset_hooks:
+                    plan.queryset_hooks.append(hints['queryset'])
+                continue
+
+            try:
+                model_field = _get_field(plan.model, snake_name)
+            except FieldDoesNotExist:
+                continue
+
+            if not model_field.is_relation:
+                plan.add_field(snake_name)
+                continue
+
+            related_type = get_named_type(graphql_type.fields[name].type)
+            related_type, related_nodes = _unwrap_connection(related_type, [field_node], fragments)
+            _plan_selection(plan.related_plan(snake_name), related_type, related_nodes, fragments)
+
+
+def plan_query(model, info):
+    """
+    Builds the QueryPlan for ``model`` from the selection of the field being
+    resolved.
+    """
+    plan = QueryPlan(model)
+    graphql_type = get_named_type(info.return_type)
+    graphql_type, field_nodes = _unwrap_connection(graphql_type, info.field_nodes, info.fragments)
+    _plan_selection(plan, graphql_type, field_nodes, info.fragments)
+    return plan
+
+
+def optimize(queryset, info):
+    """
+    Applies the plan for the current selection set to ``queryset``.
+    """
+    return plan_query(queryset.model, info).apply(queryset)
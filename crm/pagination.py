@@ -0,0 +1,140 @@
+"""
+Keyset (cursor) pagination for the Relay connections exposed by crm.schema.
+
+Pages are fetched with ``WHERE id > <cursor> ORDER BY id LIMIT n`` so the cost
+of a page does not grow with how deep the client has paged, unlike OFFSET.
+Under another ordering the cursor holds the ordering value and the id, and
+the page starts after that pair: ``WHERE (f, id) > (<value>, <id>)``.
+"""
+
+import base64
+import json
+
+import graphene
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from graphene.relay import PageInfo
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLError
+
+
+class CountableConnection(graphene.relay.Connection):
+    """
+    Relay connection with an optional ``totalCount``. The count query only
+    runs when the client selects the field.
+    """
+
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int()
+
+    def resolve_total_count(self, info):
+        if getattr(self, 'run_async', False):
+            return self.queryset.acount()
+        return self.queryset.count()
+
+
+def encode_cursor(values):
+    payload = json.dumps(values, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise GraphQLError(f"Invalid cursor: {cursor}")
+    if not isinstance(values, list) or not values:
+        raise GraphQLError(f"Invalid cursor: {cursor}")
+    return values
+
+
+def _page(queryset, first, after, order_by):
+    """
+    Returns the queryset for one page plus one extra row, and the page size.
+    """
+    max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+    if first is None:
+        first = max_limit
+    if first < 0:
+        raise GraphQLError("Argument 'first' must be a non-negative integer.")
+    first = min(first, max_limit)
+
+    if order_by is None:
+        page = queryset.order_by('pk')
+        if after is not None:
+            values = decode_cursor(after)
+            if len(values) != 1:
+                raise GraphQLError(f"Invalid cursor: {after}")
+            try:
+                page = page.filter(pk__gt=values[0])
+            except (ValidationError, ValueError, TypeError):
+                raise GraphQLError(f"Invalid cursor: {after}")
+    else:
+        field = order_by.lstrip('-')
+        descending = order_by.startswith('-')
+        # read through an annotation so it is loaded even if only() left it out
+        page = queryset.annotate(keyset_value=F(field)).order_by(order_by, '-pk' if descending else 'pk')
+        if after is not None:
+            values = decode_cursor(after)
+            if len(values) != 2:
+                raise GraphQLError(f"Invalid cursor: {after}")
+            value, pk = values
+            lookup = 'lt' if descending else 'gt'
+            try:
+                page = page.filter(
+                    Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'pk__{lookup}': pk})
+                )
+            except (ValidationError, ValueError, TypeError):
+                raise GraphQLError(f"Invalid cursor: {after}")
+
+    # one extra row tells us whether another page exists without a COUNT
+    return page[:first + 1], first
+
+
+def _connection(connection_type, queryset, nodes, first, after, order_by):
+    has_next_page = len(nodes) > first
+    nodes = nodes[:first]
+
+    edges = [
+        connection_type.Edge(
+            node=node,
+            cursor=encode_cursor([node.pk] if order_by is None else [node.keyset_value, node.pk]),
+        )
+        for node in nodes
+    ]
+    connection = connection_type(
+        edges=edges,
+        page_info=PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=after is not None,
+            has_next_page=has_next_page,
+        ),
+    )
+    connection.queryset = queryset
+    return connection
+
+
+def paginate(connection_type, queryset, first=None, after=None, order_by=None):
+    """
+    Returns one page of ``queryset`` as an instance of ``connection_type``.
+
+    ``first`` defaults to, and is capped at, the GRAPHENE
+    ``RELAY_CONNECTION_MAX_LIMIT`` setting. ``order_by`` is a non-null
+    field name, prefixed with ``-`` for descending; ties are broken by id.
+    """
+    page, first = _page(queryset, first, after, order_by)
+    return _connection(connection_type, queryset, list(page), first, after, order_by)
+
+
+async def apaginate(connection_type, queryset, first=None, after=None, order_by=None):
+    """
+    Async version of ``paginate`` for resolvers running on the event loop.
+    """
+    page, first = _page(queryset, first, after, order_by)
+    nodes = [node async for node in page]
+    connection = _connection(connection_type, queryset, nodes, first, after, order_by)
+    connection.run_async = True
+    return connection
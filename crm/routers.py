@@ -0,0 +1,85 @@
+"""
+Sends the reads of GraphQL query operations to read replicas.
+
+The /graphql views wrap each operation in ``route_reads``: query operations
+read from one of ``CRM_DB_REPLICAS``, everything else (mutations, management
+commands, the admin) uses the primary. Writes always go to the primary.
+
+Replicas lag behind the primary, so a client that just sent a mutation gets
+a cookie that keeps its queries on the primary for ``CRM_DB_STICKY_SECONDS``
+and sees its own writes.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from graphql import OperationType
+
+
+# the alias reads go to in the current context; None for the primary
+_read_alias = ContextVar('crm_read_alias', default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every alias holds the same data
+        databases = {DEFAULT_DB_ALIAS, *getattr(settings, 'CRM_DB_REPLICAS', ())}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def read_alias():
+    """
+    Returns the replica alias reads currently go to, or None for the primary.
+    """
+    return _read_alias.get()
+
+
+def _sticky(request):
+    return getattr(request, 'crm_wrote', False) or getattr(settings, 'CRM_DB_STICKY_COOKIE', 'crm_primary') in request.COOKIES
+
+
+@contextmanager
+def route_reads(request, operation_ast):
+    """
+    Runs the block with reads going to a replica when ``operation_ast`` is a
+    query and ``request`` is not pinned to the primary. Marks the request
+    as having written once a mutation was executed.
+    """
+    replicas = getattr(settings, 'CRM_DB_REPLICAS', ())
+    is_query = operation_ast is not None and operation_ast.operation == OperationType.QUERY
+    alias = random.choice(replicas) if replicas and is_query and not _sticky(request) else None
+
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+        if operation_ast is not None and operation_ast.operation == OperationType.MUTATION:
+            request.crm_wrote = True
+
+
+def stick_to_primary(request, response):
+    """
+    Sets the cookie keeping the client's reads on the primary when
+    ``request`` sent a mutation.
+    """
+    if getattr(request, 'crm_wrote', False):
+        response.set_cookie(
+            getattr(settings, 'CRM_DB_STICKY_COOKIE', 'crm_primary'),
+            '1',
+            max_age=getattr(settings, 'CRM_DB_STICKY_SECONDS', 5),
+            httponly=True,
+            samesite='Lax',
+        )
+    return response
@@ -1,17 +1,49 @@
 import graphene
 from graphene_django import DjangoObjectType
+from graphene_django.settings import graphene_settings
 import re
-from django.db import transaction
+from collections import defaultdict
+from inspect import isawaitable
+from django.db import DatabaseError, IntegrityError, connection, transaction
 from django.core.exceptions import ValidationError
-from django.utils import timezone
-from datetime import timedelta
-from .models import Customer, Product, Order, OrderItem
+from .models import Customer, CustomerOrderSummary, Product, Order, OrderDailySummary, OrderItem
+from .loaders import get_loaders
+from .pagination import CountableConnection, apaginate, paginate
+from .filters import (
+    CustomerFilter,
+    CustomerOrdering,
+    OrderFilter,
+    OrderOrdering,
+    ProductFilter,
+    ProductOrdering,
+    filter_queryset,
+    list_arguments,
+)
+from .optimizer import optimize, plan_query, query_hints
+from .cache import invalidate
+from .summaries import record_new_orders
+
+
+PHONE_PATTERN = re.compile(r'^\+?[0-9]{10,15}$|^[0-9]{3}-[0-9]{3}-[0-9]{4}$')
+PHONE_FORMAT_ERROR = "Invalid phone format. Use +1234567890 or 123-456-7890"
+
+# rows per INSERT statement for bulk mutations
+BULK_CREATE_BATCH_SIZE = 1000
 
 
 class CustomerType(DjangoObjectType):
     class Meta:
         model = Customer
         fields = "__all__"
+    
+    def resolve_orders(self, info):
+        loaders = get_loaders(info)
+        if 'orders' not in getattr(self, '_prefetched_objects_cache', {}):
+            # the loader queues the items of what it loads
+            return loaders.customer_orders.load(self.pk)
+        orders = list(self.orders.all())
+        loaders.queue_orders(orders)
+        return orders
 
 
 class ProductType(DjangoObjectType):
@@ -20,6 +52,20 @@ class ProductType(DjangoObjectType):
         fields = "__all__"
 
 
+def _order_items(order, info):
+    """
+    Returns an order's items with their products, from the prefetch cache when
+    the optimizer planned one and from the request's loaders otherwise.
+    """
+    if 'items' in getattr(order, '_prefetched_objects_cache', {}):
+        return list(order.items.all())
+    return get_loaders(info).order_items.load(order.pk)
+
+
+async def _products(items):
+    return [item.product for item in await items]
+
+
 class OrderType(DjangoObjectType):
     products = graphene.List(ProductType)
     total_amount = graphene.Float()
@@ -28,11 +74,20 @@ class OrderType(DjangoObjectType):
         model = Order
         fields = "__all__"
     
-    def resolve_products(self, info):
-        return [item.product for item in self.items.all()]
+    def resolve_customer(self, info):
+        if Order.customer.is_cached(self):
+            return self.customer
+        return get_loaders(info).customer.load(self.customer_id)
+    
+    def resolve_items(self, info):
+        return _order_items(self, info)
     
-    def resolve_total_amount(self, info):
-        return sum(item.product.price * item.quantity for item in self.items.all())
+    @query_hints(prefetch_related=('items__product',))
+    def resolve_products(self, info):
+        items = _order_items(self, info)
+        if isawaitable(items):
+            return _products(items)
+        return [item.product for item in items]
 
 
 class OrderItemType(DjangoObjectType):
@@ -41,6 +96,33 @@ class OrderItemType(DjangoObjectType):
         fields = "__all__"
 
 
+class OrderDailySummaryType(DjangoObjectType):
+    class Meta:
+        model = OrderDailySummary
+        fields = ('day', 'status', 'order_count', 'revenue')
+
+
+class CustomerOrderSummaryType(DjangoObjectType):
+    class Meta:
+        model = CustomerOrderSummary
+        fields = ('customer', 'order_count', 'revenue')
+
+
+class CustomerConnection(CountableConnection):
+    class Meta:
+        node = CustomerType
+
+
+class ProductConnection(CountableConnection):
+    class Meta:
+        node = ProductType
+
+
+class OrderConnection(CountableConnection):
+    class Meta:
+        node = OrderType
+
+
 class CustomerInput(graphene.InputObjectType):
     name = graphene.String(required=True)
     email = graphene.String(required=True)
@@ -53,9 +135,15 @@ class ProductInput(graphene.InputObjectType):
     stock = graphene.Int(required=False)
 
 
+class OrderLineInput(graphene.InputObjectType):
+    product_id = graphene.ID(required=True)
+    quantity = graphene.Int(required=False, default_value=1)
+
+
 class OrderInput(graphene.InputObjectType):
     customer_id = graphene.ID(required=True)
-    product_ids = graphene.List(graphene.ID, required=True)
+    product_ids = graphene.List(graphene.ID, required=False)
+    items = graphene.List(OrderLineInput, required=False)
     order_date = graphene.DateTime(required=False)
 
 
@@ -68,10 +156,8 @@ class CreateCustomer(graphene.Mutation):
     
     @staticmethod
     def validate_phone(phone):
-        if phone:
-            pattern = r'^\+?[0-9]{10,15}$|^[0-9]{3}-[0-9]{3}-[0-9]{4}$'
-            if not re.match(pattern, phone):
-                raise ValidationError("Invalid phone format. Use +1234567890 or 123-456-7890")
+        if phone and not PHONE_PATTERN.match(phone):
+            raise ValidationError(PHONE_FORMAT_ERROR)
     
     def mutate(self, info, input):
         try:
@@ -94,6 +180,19 @@ class CreateCustomer(graphene.Mutation):
             return CreateCustomer(customer=None, message=f"An error occurred: {str(e)}")
 
 
+def _too_long(customer_data):
+    """
+    Returns the error for the first of a customer's name, email and phone
+    that doesn't fit its column, or None.
+    """
+    for name in ('name', 'email', 'phone'):
+        value = getattr(customer_data, name)
+        max_length = Customer._meta.get_field(name).max_length
+        if value and len(value) > max_length:
+            return f"{name.capitalize()} must be at most {max_length} characters"
+    return None
+
+
 class BulkCreateCustomers(graphene.Mutation):
     class Arguments:
         input = graphene.List(CustomerInput, required=True)
@@ -101,33 +200,74 @@ class BulkCreateCustomers(graphene.Mutation):
     customers = graphene.List(CustomerType)
     errors = graphene.List(graphene.String)
     
+    @staticmethod
+    def existing_emails(emails):
+        """
+        Returns the subset of ``emails`` already in use, looked up with as few
+        IN (...) queries as the backend's parameter limit allows.
+        """
+        existing = set()
+        if not emails:
+            return existing
+        batch_size = connection.ops.bulk_batch_size(['email'], emails) or len(emails)
+        for start in range(0, len(emails), batch_size):
+            existing.update(
+                Customer.objects.filter(email__in=emails[start:start + batch_size])
+                .values_list('email', flat=True)
+            )
+        return existing
+    
     def mutate(self, info, input):
-        customers = []
-        errors = []
+        rows = []
+        errors = {}
         
-        with transaction.atomic():
-            for i, customer_data in enumerate(input):
+        taken = BulkCreateCustomers.existing_emails(list({c.email for c in input}))
+        for i, customer_data in enumerate(input):
+            if customer_data.email in taken:
+                errors[i] = f"Customer {i+1}: Email {customer_data.email} already exists"
+                continue
+            
+            if customer_data.phone and not PHONE_PATTERN.match(customer_data.phone):
+                errors[i] = f"Customer {i+1}: {PHONE_FORMAT_ERROR}"
+                continue
+            
+            too_long = _too_long(customer_data)
+            if too_long:
+                errors[i] = f"Customer {i+1}: {too_long}"
+                continue
+            
+            # later rows with the same email are rejected as duplicates
+            taken.add(customer_data.email)
+            rows.append((i, Customer(
+                name=customer_data.name,
+                email=customer_data.email,
+                phone=customer_data.phone
+            )))
+        
+        try:
+            with transaction.atomic():
+                customers = Customer.objects.bulk_create(
+                    [customer for _, customer in rows], batch_size=BULK_CREATE_BATCH_SIZE
+                )
+        except DatabaseError:
+            # e.g. another request inserted some of these emails since the
+            # lookup: insert row by row so that only the failing rows are rejected
+            customers = []
+            for i, customer in rows:
+                customer.pk = None
                 try:
-                    if Customer.objects.filter(email=customer_data.email).exists():
-                        errors.append(f"Customer {i+1}: Email {customer_data.email} already exists")
-                        continue
-                    
-                    if customer_data.phone:
-                        pattern = r'^\+?[0-9]{10,15}$|^[0-9]{3}-[0-9]{3}-[0-9]{4}$'
-                        if not re.match(pattern, customer_data.phone):
-                            errors.append(f"Customer {i+1}: Invalid phone format. Use +1234567890 or 123-456-7890")
-                            continue
-                    
-                    customer = Customer(
-                        name=customer_data.name,
-                        email=customer_data.email,
-                        phone=customer_data.phone
-                    )
-                    customer.save()
+                    with transaction.atomic():
+                        customer.save(force_insert=True)
+                except IntegrityError:
+                    errors[i] = f"Customer {i+1}: Email {customer.email} already exists"
+                except DatabaseError as e:
+                    errors[i] = f"Customer {i+1}: Could not be created: {e}"
+                else:
                     customers.append(customer)
-                except Exception as e:
-                    errors.append(f"Customer {i+1}: {str(e)}")
+        if customers:
+            invalidate(Customer)
         
+        errors = [errors[i] for i in sorted(errors)]
         return BulkCreateCustomers(customers=customers, errors=errors)
 
 
@@ -145,10 +285,12 @@ class CreateProduct(graphene.Mutation):
             if input.stock is not None and input.stock < 0:
                 raise ValidationError("Stock cannot be negative")
             
+            stock = input.stock or 0
             product = Product(
                 name=input.name,
                 price=input.price,
-                in_stock=(input.stock > 0 if input.stock is not None else True)
+                stock=stock,
+                in_stock=stock > 0
             )
             product.save()
             
@@ -157,6 +299,112 @@ class CreateProduct(graphene.Mutation):
             raise Exception(f"Failed to create product: {str(e)}")
 
 
+def _parse_pk(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _order_lines(order_input):
+    """
+    Returns (product_id, quantity) pairs for an OrderInput. Each entry in the
+    legacy product_ids list counts as a line with quantity 1.
+    """
+    lines = [(product_id, 1) for product_id in order_input.product_ids or []]
+    lines += [(line.product_id, line.quantity) for line in order_input.items or []]
+    return lines
+
+
+def _stock_needed(orders):
+    needed = defaultdict(int)
+    for order in orders:
+        for item in order.created_items:
+            needed[item.product_id] += item.quantity
+    return needed
+
+
+def _insufficient_stock_message(order):
+    needed = _stock_needed([order])
+    stock = dict(Product.objects.filter(pk__in=needed).values_list('pk', 'stock'))
+    short = [str(product_id) for product_id, quantity in needed.items() if stock.get(product_id, 0) < quantity]
+    return f"Insufficient stock for product {', '.join(short)}"
+
+
+def create_orders(order_inputs):
+    """
+    Validates and creates one order per input using a fixed number of
+    queries: one for customers, one for products, one conditional UPDATE
+    reserving stock for every line and one bulk insert each for orders and
+    their items, all in a single transaction.
+
+    Returns, for each input in order, either the created Order (with its
+    items cached on ``order.created_items``) or the ValidationError that
+    rejected it.
+    """
+    lines_per_order = [_order_lines(order_input) for order_input in order_inputs]
+    customers = Customer.objects.in_bulk(
+        {_parse_pk(order_input.customer_id) for order_input in order_inputs} - {None}
+    )
+    products = Product.objects.in_bulk(
+        {_parse_pk(product_id) for lines in lines_per_order for product_id, _ in lines} - {None}
+    )
+    
+    results = []
+    for order_input, lines in zip(order_inputs, lines_per_order):
+        try:
+            customer = customers.get(_parse_pk(order_input.customer_id))
+            if customer is None:
+                raise ValidationError(f"Customer with ID {order_input.customer_id} does not exist")
+            
+            if not lines:
+                raise ValidationError("At least one product must be selected")
+            
+            order = Order(customer=customer)
+            order.created_items = []
+            for product_id, quantity in lines:
+                product = products.get(_parse_pk(product_id))
+                if product is None:
+                    raise ValidationError(f"Product with ID {product_id} does not exist")
+                if quantity is None or quantity < 1:
+                    raise ValidationError(f"Quantity for product {product_id} must be at least 1")
+                order.created_items.append(OrderItem(
+                    order=order, product=product, quantity=quantity, unit_price=product.price,
+                ))
+            order.total_amount = sum(item.unit_price * item.quantity for item in order.created_items)
+            results.append(order)
+        except ValidationError as e:
+            results.append(e)
+    
+    orders = [result for result in results if isinstance(result, Order)]
+    if orders:
+        with transaction.atomic():
+            if not Product.objects.reserve_stock(_stock_needed(orders)):
+                # at least one order can't be filled: reserve order by order
+                # to find out which, keeping the ones that fit
+                for i, result in enumerate(results):
+                    if isinstance(result, Order) and not Product.objects.reserve_stock(_stock_needed([result])):
+                        results[i] = ValidationError(_insufficient_stock_message(result))
+                orders = [result for result in results if isinstance(result, Order)]
+            
+            Order.objects.bulk_create(orders, batch_size=BULK_CREATE_BATCH_SIZE)
+            OrderItem.objects.bulk_create(
+                [item for order in orders for item in order.created_items],
+                batch_size=BULK_CREATE_BATCH_SIZE,
+            )
+            record_new_orders(orders)
+        # bulk_create and update() don't send the signals that normally do this
+        invalidate(Product, Order, OrderItem)
+    return results
+
+
+def _prime_created_orders(info, orders):
+    loaders = get_loaders(info)
+    for order in orders:
+        loaders.order_items.prime(order.pk, order.created_items)
+    loaders.queue_orders(orders)
+
+
 class CreateOrder(graphene.Mutation):
     class Arguments:
         input = OrderInput(required=True)
@@ -165,41 +413,36 @@ class CreateOrder(graphene.Mutation):
     
     def mutate(self, info, input):
         try:
-            try:
-                customer = Customer.objects.get(pk=input.customer_id)
-            except Customer.DoesNotExist:
-                raise ValidationError(f"Customer with ID {input.customer_id} does not exist")
-            
-            if not input.product_ids or len(input.product_ids) == 0:
-                raise ValidationError("At least one product must be selected")
-            
-            products = []
-            for product_id in input.product_ids:
-                try:
-                    product = Product.objects.get(pk=product_id)
-                    products.append(product)
-                except Product.DoesNotExist:
-                    raise ValidationError(f"Product with ID {product_id} does not exist")
-            
-            with transaction.atomic():
-                order = Order(
-                    customer=customer,
-                )
-                order.save()
-                
-                for product in products:
-                    order_item = OrderItem(
-                        order=order,
-                        product=product,
-                        quantity=1 
-                    )
-                    order_item.save()
-            
-            return CreateOrder(order=order)
-        except ValidationError as e:
-            raise Exception(str(e))
+            (result,) = create_orders([input])
         except Exception as e:
             raise Exception(f"Failed to create order: {str(e)}")
+        
+        if isinstance(result, ValidationError):
+            raise Exception(result.message)
+        
+        _prime_created_orders(info, [result])
+        return CreateOrder(order=result)
+
+
+class BulkCreateOrders(graphene.Mutation):
+    class Arguments:
+        input = graphene.List(OrderInput, required=True)
+    
+    orders = graphene.List(OrderType)
+    errors = graphene.List(graphene.String)
+    
+    def mutate(self, info, input):
+        orders = []
+        errors = []
+        
+        for i, result in enumerate(create_orders(input)):
+            if isinstance(result, ValidationError):
+                errors.append(f"Order {i+1}: {result.message}")
+            else:
+                orders.append(result)
+        
+        _prime_created_orders(info, orders)
+        return BulkCreateOrders(orders=orders, errors=errors)
 
 
 class Mutation(graphene.ObjectType):
@@ -207,49 +450,148 @@ class Mutation(graphene.ObjectType):
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
     create_order = CreateOrder.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
+
+
+def _daily_summaries(date_from, date_to, status):
+    """
+    Daily rollups between ``date_from`` and ``date_to`` (both inclusive).
+    """
+    # rows that all orders moved out of stay behind with a zero count
+    summaries = OrderDailySummary.objects.filter(order_count__gt=0).order_by('day', 'status')
+    if date_from is not None:
+        summaries = summaries.filter(day__gte=date_from)
+    if date_to is not None:
+        summaries = summaries.filter(day__lte=date_to)
+    if status is not None:
+        summaries = summaries.filter(status=status)
+    return summaries
+
+
+def _top_customers(first):
+    first = max(0, min(first, graphene_settings.RELAY_CONNECTION_MAX_LIMIT))
+    return CustomerOrderSummary.objects.order_by('-revenue', 'pk')[:first]
+
+
+def _get_or_none(queryset, pk):
+    try:
+        return queryset.get(pk=pk)
+    except queryset.model.DoesNotExist:
+        return None
+
+
+def _ordering(order_by):
+    # graphene passes the enum member; paginate wants its field name
+    return getattr(order_by, 'value', order_by)
 
 
 class Query(graphene.ObjectType):
-    all_customers = graphene.List(CustomerType)
+    all_customers = graphene.Field(
+        CustomerConnection, **list_arguments(CustomerFilter, CustomerType, CustomerOrdering)
+    )
     customer_by_id = graphene.Field(CustomerType, id=graphene.Int(required=True))
     
-    all_products = graphene.List(ProductType)
+    all_products = graphene.Field(
+        ProductConnection, **list_arguments(ProductFilter, ProductType, ProductOrdering)
+    )
     product_by_id = graphene.Field(ProductType, id=graphene.Int(required=True))
     
-    all_orders = graphene.List(OrderType)
+    all_orders = graphene.Field(
+        OrderConnection, **list_arguments(OrderFilter, OrderType, OrderOrdering)
+    )
     order_by_id = graphene.Field(OrderType, id=graphene.Int(required=True))
     pending_orders_last_week = graphene.List(OrderType)
+    
+    daily_order_summaries = graphene.List(
+        OrderDailySummaryType,
+        date_from=graphene.Date(),
+        date_to=graphene.Date(),
+        status=graphene.String(),
+    )
+    top_customers = graphene.List(CustomerOrderSummaryType, first=graphene.Int(default_value=10))
 
-    def resolve_all_customers(self, info):
-        return Customer.objects.all()
+    def resolve_all_customers(self, info, first=None, after=None, order_by=None, **filters):
+        queryset = optimize(filter_queryset(CustomerFilter, Customer.objects.all(), filters), info)
+        return paginate(CustomerConnection, queryset, first, after, _ordering(order_by))
         
     def resolve_customer_by_id(self, info, id):
-        try:
-            return Customer.objects.get(pk=id)
-        except Customer.DoesNotExist:
-            return None
+        plan = plan_query(Customer, info)
+        return get_loaders(info).lookup(info, plan, lambda: _get_or_none(plan.apply(Customer.objects.all()), id), id=id)
             
-    def resolve_all_products(self, info):
-        return Product.objects.all()
+    def resolve_all_products(self, info, first=None, after=None, order_by=None, **filters):
+        queryset = optimize(filter_queryset(ProductFilter, Product.objects.all(), filters), info)
+        return paginate(ProductConnection, queryset, first, after, _ordering(order_by))
         
     def resolve_product_by_id(self, info, id):
-        try:
-            return Product.objects.get(pk=id)
-        except Product.DoesNotExist:
-            return None
+        plan = plan_query(Product, info)
+        return get_loaders(info).lookup(info, plan, lambda: _get_or_none(plan.apply(Product.objects.all()), id), id=id)
             
-    def resolve_all_orders(self, info):
-        return Order.objects.all()
+    def resolve_all_orders(self, info, first=None, after=None, order_by=None, **filters):
+        queryset = optimize(filter_queryset(OrderFilter, Order.objects.all(), filters), info)
+        connection = paginate(OrderConnection, queryset, first, after, _ordering(order_by))
+        get_loaders(info).queue_orders([edge.node for edge in connection.edges])
+        return connection
         
     def resolve_order_by_id(self, info, id):
+        plan = plan_query(Order, info)
+        return get_loaders(info).lookup(info, plan, lambda: _get_or_none(plan.apply(Order.objects.all()), id), id=id)
+    
+    def resolve_pending_orders_last_week(self, info):
+        orders = list(optimize(Order.objects.pending_last_week(), info))
+        get_loaders(info).queue_orders(orders)
+        return orders
+    
+    def resolve_daily_order_summaries(self, info, date_from=None, date_to=None, status=None):
+        return list(optimize(_daily_summaries(date_from, date_to, status), info))
+    
+    def resolve_top_customers(self, info, first=10):
+        return list(optimize(_top_customers(first), info))
+
+
+class AsyncQuery(Query):
+    """
+    The same fields as Query, resolved with Django's async ORM so that they
+    can run on the event loop under ASGI. Nested fields are read from what
+    the optimizer preloads, or else awaited from the request's AsyncLoaders,
+    so they never touch the database synchronously.
+    """
+
+    async def resolve_all_customers(self, info, first=None, after=None, order_by=None, **filters):
+        queryset = optimize(filter_queryset(CustomerFilter, Customer.objects.all(), filters), info)
+        return await apaginate(CustomerConnection, queryset, first, after, _ordering(order_by))
+    
+    async def resolve_customer_by_id(self, info, id):
+        try:
+            return await optimize(Customer.objects.all(), info).aget(pk=id)
+        except Customer.DoesNotExist:
+            return None
+    
+    async def resolve_all_products(self, info, first=None, after=None, order_by=None, **filters):
+        queryset = optimize(filter_queryset(ProductFilter, Product.objects.all(), filters), info)
+        return await apaginate(ProductConnection, queryset, first, after, _ordering(order_by))
+    
+    async def resolve_product_by_id(self, info, id):
         try:
-            return Order.objects.get(pk=id)
+            return await optimize(Product.objects.all(), info).aget(pk=id)
+        except Product.DoesNotExist:
+            return None
+    
+    async def resolve_all_orders(self, info, first=None, after=None, order_by=None, **filters):
+        queryset = optimize(filter_queryset(OrderFilter, Order.objects.all(), filters), info)
+        return await apaginate(OrderConnection, queryset, first, after, _ordering(order_by))
+    
+    async def resolve_order_by_id(self, info, id):
+        try:
+            return await optimize(Order.objects.all(), info).aget(pk=id)
         except Order.DoesNotExist:
             return None
     
-    def resolve_pending_orders_last_week(self, info):
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        return Order.objects.filter(
-            status='pending',
-            date_ordered__gte=seven_days_ago
-        ).select_related('customer')
+    async def resolve_pending_orders_last_week(self, info):
+        queryset = optimize(Order.objects.pending_last_week(), info)
+        return [order async for order in queryset]
+    
+    async def resolve_daily_order_summaries(self, info, date_from=None, date_to=None, status=None):
+        return [summary async for summary in optimize(_daily_summaries(date_from, date_to, status), info)]
+    
+    async def resolve_top_customers(self, info, first=10):
+        return [summary async for summary in optimize(_top_customers(first), info)]
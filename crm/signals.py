@@ -0,0 +1,66 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import invalidate
+from .models import Customer, Product, Order, OrderItem
+from .summaries import ORDER_FIELDS, apply_order_change
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=OrderItem)
+def invalidate_cached_responses(sender, **kwargs):
+    invalidate(sender)
+
+
+def _order_values(order):
+    return {field: getattr(order, field) for field in ORDER_FIELDS}
+
+
+def _deleted_with(origin, *models):
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin_model in models
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_rollups(sender, instance, **kwargs):
+    # the stored row, which the in-memory instance may not match
+    instance._rollup_values = None if instance._state.adding else (
+        Order.objects.filter(pk=instance.pk).values(*ORDER_FIELDS).first()
+    )
+
+
+@receiver(post_save, sender=Order)
+def update_order_rollups(sender, instance, **kwargs):
+    apply_order_change(getattr(instance, '_rollup_values', None), _order_values(instance))
+    instance._rollup_values = None
+
+
+@receiver(post_delete, sender=Order)
+def remove_order_rollups(sender, instance, origin=None, **kwargs):
+    # a deleted customer takes its rollup row with it
+    apply_order_change(_order_values(instance), None, customer_rollups=not _deleted_with(origin, Customer))
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def refresh_item_order(sender, instance, origin=None, **kwargs):
+    # items deleted along with their order or customer have no total to keep
+    if _deleted_with(origin, Order, Customer):
+        return
+    orders = Order.objects.filter(pk=instance.order_id)
+    with transaction.atomic():
+        before = orders.select_for_update().values(*ORDER_FIELDS).first()
+        if before is None:
+            return
+        orders.refresh_totals()
+        after = {**before, 'total_amount': orders.values_list('total_amount', flat=True).get()}
+        apply_order_change(before, after)
+    invalidate(Order)
@@ -0,0 +1,166 @@
+"""
+Maintenance of the order rollup tables, OrderDailySummary and
+CustomerOrderSummary.
+
+Every change to an order is applied to the rollups as a signed delta of
+its count and revenue: new orders from ``create_orders`` through
+``record_new_orders``, model saves and deletes through
+``apply_order_change`` (see crm.signals). Deltas are increments made by a
+single UPDATE (``SummaryQuerySet.add``), so concurrent writers add up
+rather than overwrite each other.
+
+Inside a transaction the deltas are summed up and only written once it
+commits, in a short transaction of their own. Checkouts therefore don't
+hold the lock on the day's rollup row (which every one of them updates)
+while they run, and don't queue behind each other on it. A process dying
+between the two commits leaves the rollups behind; ``rebuild`` recomputes
+everything, e.g. then or after bulk loads that bypass both paths.
+
+Revenue is the sum of the orders' stored ``total_amount``.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .cache import invalidate
+from .models import CustomerOrderSummary, Order, OrderDailySummary
+from .transactions import PendingWork, pending_on_commit
+
+
+# rollups written per statement by rebuild
+BATCH_SIZE = 1000
+
+# the order fields a rollup depends on
+ORDER_FIELDS = ('date_ordered', 'status', 'customer_id', 'total_amount')
+
+
+def order_day(order):
+    return timezone.localdate(order.date_ordered)
+
+
+def _revenue():
+    return Coalesce(Sum('total_amount'), Decimal('0.00'))
+
+
+def _deltas():
+    return defaultdict(lambda: [0, Decimal('0.00')])
+
+
+class _PendingDeltas(PendingWork):
+    """
+    The on_commit callback writing the deltas a transaction accumulated.
+    """
+
+    def __init__(self):
+        self.daily = _deltas()
+        self.customers = _deltas()
+
+    def merge(self, daily, customers):
+        for pending, deltas in ((self.daily, daily), (self.customers, customers)):
+            for key, (count, revenue) in deltas.items():
+                pending[key][0] += count
+                pending[key][1] += revenue
+
+    def run(self):
+        _write(self.daily, self.customers)
+
+
+def _add(daily, customers):
+    if transaction.get_connection().in_atomic_block:
+        pending_on_commit(_PendingDeltas).merge(daily, customers)
+    else:
+        _write(daily, customers)
+
+
+def _write(daily, customers):
+    OrderDailySummary.objects.add([
+        ({'day': day, 'status': status}, count, revenue)
+        for (day, status), (count, revenue) in daily.items()
+        if count or revenue
+    ])
+    CustomerOrderSummary.objects.add([
+        ({'customer_id': customer_id}, count, revenue)
+        for customer_id, (count, revenue) in customers.items()
+        if count or revenue
+    ])
+    invalidate(OrderDailySummary, CustomerOrderSummary)
+
+
+def record_new_orders(orders):
+    """
+    Adds freshly inserted ``orders`` to the rollups.
+    """
+    daily = _deltas()
+    customers = _deltas()
+    for order in orders:
+        for totals in (daily[(order_day(order), order.status)], customers[order.customer_id]):
+            totals[0] += 1
+            totals[1] += order.total_amount
+    _add(daily, customers)
+
+
+def apply_order_change(before, after, customer_rollups=True):
+    """
+    Moves an order's count and revenue out of the rollups of ``before`` and
+    into those of ``after``. Each is a dict of the ORDER_FIELDS values, or
+    None for an order that is being created or deleted.
+
+    ``customer_rollups`` is False when the customer, and with it its rollup,
+    is being deleted.
+    """
+    daily = _deltas()
+    customers = _deltas()
+    for values, sign in ((before, -1), (after, 1)):
+        if values is None:
+            continue
+        day = timezone.localdate(values['date_ordered'])
+        for totals in (daily[(day, values['status'])], customers[values['customer_id']]):
+            totals[0] += sign
+            totals[1] += sign * values['total_amount']
+    if not customer_rollups:
+        customers.clear()
+    _add(daily, customers)
+
+
+def rebuild(batch_size=BATCH_SIZE):
+    """
+    Recomputes every rollup from the orders in one transaction. Returns
+    the number of daily and customer rows written.
+    """
+    with transaction.atomic():
+        OrderDailySummary.objects.all().delete()
+        daily = (
+            Order.objects.annotate(day=TruncDate('date_ordered'))
+            .values('day', 'status')
+            .annotate(order_count=Count('pk'), revenue=_revenue())
+            .order_by()
+        )
+        daily_rows = _insert(OrderDailySummary, daily, batch_size)
+
+        CustomerOrderSummary.objects.all().delete()
+        customers = (
+            Order.objects.values('customer_id')
+            .annotate(order_count=Count('pk'), revenue=_revenue())
+            .order_by()
+        )
+        customer_rows = _insert(CustomerOrderSummary, customers, batch_size)
+    invalidate(OrderDailySummary, CustomerOrderSummary)
+    return daily_rows, customer_rows
+
+
+def _insert(model, rows, batch_size):
+    count = 0
+    batch = []
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(model(**row))
+        if len(batch) == batch_size:
+            model.objects.bulk_create(batch)
+            count += len(batch)
+            batch = []
+    model.objects.bulk_create(batch)
+    return count + len(batch)
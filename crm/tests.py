@@ -1,3 +1,1455 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DataError, OperationalError, connection, connections, transaction
+from django.db.models import Sum
+from django.db.utils import ConnectionHandler, load_backend
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.testing import GraphQLTestCase
+from graphql import parse
+
+from alx_backend_graphql_crm.cache import cache_config
+from alx_backend_graphql_crm.database import database_config, replica_configs
+
+from . import cache as cache_module
+from .cache import get_or_execute
+from .cron import HEALTHZ_URL, log_crm_heartbeat
+from .documents import document_cache
+from .loaders import Loaders
+from .metrics import metrics
+from .models import Customer, CustomerOrderSummary, Product, Order, OrderDailySummary, OrderItem
+from .pagination import encode_cursor
+from .schema import create_orders
+from .summaries import rebuild as rebuild_summaries
+
+
+class CRMTestCase(GraphQLTestCase):
+    """
+    Shared fixtures: three customers with two orders each, every order
+    holding two of the three products.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = [
+            Product.objects.create(name='Laptop', price=Decimal('999.99'), stock=10),
+            Product.objects.create(name='Mouse', price=Decimal('19.50'), stock=50),
+            Product.objects.create(name='Monitor', price=Decimal('349.99'), stock=8),
+        ]
+        cls.customers = []
+        cls.orders = []
+        for i in range(3):
+            customer = Customer.objects.create(name=f'Customer {i}', email=f'customer{i}@example.com')
+            cls.customers.append(customer)
+            for _ in range(2):
+                order = Order.objects.create(customer=customer)
+                OrderItem.objects.create(order=order, product=cls.products[0], quantity=1)
+                OrderItem.objects.create(order=order, product=cls.products[1], quantity=2)
+                cls.orders.append(order)
+
+    def execute(self, query, variables=None):
+        response = self.query(query, variables=variables)
+        self.assertResponseNoErrors(response)
+        return json.loads(response.content)['data']
+
+
+class OrderLoaderTests(CRMTestCase):
+    def test_all_orders_batches_relationships(self):
+        query = '''
+            query {
+                allOrders {
+                    edges {
+                        node {
+                            id
+                            totalAmount
+                            products { name }
+                            customer { email }
+                        }
+                    }
+                }
+            }
+        '''
+        # orders joined to their customers, then items joined to products
+        with self.assertNumQueries(2):
+            data = self.execute(query)
+
+        orders = [edge['node'] for edge in data['allOrders']['edges']]
+        self.assertEqual(len(orders), 6)
+        for order in orders:
+            self.assertAlmostEqual(order['totalAmount'], 1038.99)
+            self.assertEqual([p['name'] for p in order['products']], ['Laptop', 'Mouse'])
+
+    def test_nested_customer_orders_are_batched(self):
+        query = '''
+            query {
+                allCustomers {
+                    edges { node { orders { products { name } } } }
+                }
+            }
+        '''
+        # customers, their orders, then items joined to products
+        with self.assertNumQueries(3):
+            self.execute(query)
+
+    def test_customer_orders_are_batched_without_a_prefetch(self):
+        mutation = '''
+            mutation ($input: [OrderInput]!) {
+                bulkCreateOrders(input: $input) { orders { customer { orders { id } } } }
+            }
+        '''
+        inputs = [
+            {'customerId': customer.pk, 'items': [{'productId': self.products[1].pk, 'quantity': 1}]}
+            for customer in self.customers
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            data = self.execute(mutation, {'input': inputs})['bulkCreateOrders']
+
+        self.assertEqual([len(order['customer']['orders']) for order in data['orders']], [3, 3, 3])
+        order_reads = [q for q in queries if q['sql'].startswith('SELECT') and 'FROM "crm_order"' in q['sql']]
+        self.assertEqual(len(order_reads), 1)
+
+    def test_loaders_batch_queued_orders(self):
+        loaders = Loaders()
+        orders = list(Order.objects.all())
+        loaders.queue_orders(orders)
+
+        # items, products and customers: one query each for every order
+        with self.assertNumQueries(3):
+            for order in orders:
+                items = loaders.order_items.load(order.pk)
+                self.assertEqual([item.product.name for item in items], ['Laptop', 'Mouse'])
+                loaders.customer.load(order.customer_id)
+
+
+class OrderTotalsTests(CRMTestCase):
+    def test_with_totals_annotates_in_sql(self):
+        empty = Order.objects.create(customer=self.customers[0])
+        with self.assertNumQueries(1):
+            totals = dict(Order.objects.with_totals().values_list('pk', 'order_total'))
+
+        self.assertEqual(totals[self.orders[0].pk], Decimal('1038.99'))
+        self.assertEqual(totals[empty.pk], Decimal('0.00'))
+        self.assertEqual(
+            Order.objects.with_totals().order_by('order_total').first(),
+            empty,
+        )
+
+    def test_total_amount_is_read_from_the_order(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.execute('query { allOrders { edges { node { totalAmount } } } }')
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('JOIN', queries[0]['sql'])
+        self.assertAlmostEqual(data['allOrders']['edges'][0]['node']['totalAmount'], 1038.99)
+
+    def test_repricing_keeps_placed_orders(self):
+        laptop = self.products[0]
+        laptop.price = Decimal('1299.99')
+        laptop.save()
+
+        order = Order.objects.get(pk=self.orders[0].pk)
+        self.assertEqual(order.total_amount, Decimal('1038.99'))
+        self.assertEqual(order.items.get(product=laptop).unit_price, Decimal('999.99'))
+
+    def test_item_changes_refresh_the_total(self):
+        order = self.orders[0]
+        item = order.items.get(product=self.products[1])
+        item.quantity = 3
+        item.save()
+        self.assertEqual(Order.objects.get(pk=order.pk).total_amount, Decimal('1058.49'))
+
+        item.delete()
+        self.assertEqual(Order.objects.get(pk=order.pk).total_amount, Decimal('999.99'))
+
+
+class PaginationTests(CRMTestCase):
+    orders_query = '''
+        query ($first: Int, $after: String) {
+            allOrders(first: $first, after: $after) {
+                edges { cursor node { id } }
+                pageInfo { hasNextPage endCursor }
+            }
+        }
+    '''
+
+    def test_pages_follow_cursor(self):
+        seen = []
+        after = None
+        while True:
+            page = self.execute(self.orders_query, {'first': 4, 'after': after})['allOrders']
+            seen += [int(edge['node']['id']) for edge in page['edges']]
+            if not page['pageInfo']['hasNextPage']:
+                break
+            after = page['pageInfo']['endCursor']
+
+        self.assertEqual(seen, [order.pk for order in self.orders])
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(graphene_settings, 'RELAY_CONNECTION_MAX_LIMIT', 2):
+            page = self.execute(self.orders_query, {'first': 50})['allOrders']
+        self.assertEqual(len(page['edges']), 2)
+        self.assertTrue(page['pageInfo']['hasNextPage'])
+
+    def test_total_count_only_when_selected(self):
+        with self.assertNumQueries(1):
+            self.execute('query { allCustomers(first: 1) { edges { node { id } } } }')
+        with self.assertNumQueries(2):
+            data = self.execute('query { allCustomers(first: 1) { totalCount } }')
+        self.assertEqual(data['allCustomers']['totalCount'], 3)
+
+    def test_invalid_cursor(self):
+        response = self.query(self.orders_query, variables={'after': 'not-a-cursor'})
+        self.assertResponseHasErrors(response)
+
+    def test_cursor_holding_something_other_than_an_id(self):
+        for values in (['abc'], [{}], [1, 2]):
+            response = self.query(self.orders_query, variables={'after': encode_cursor(values)})
+            self.assertIn('Invalid cursor', json.loads(response.content)['errors'][0]['message'])
+
+
+class OptimizerTests(CRMTestCase):
+    def test_only_selected_columns_are_fetched(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.execute('query { allCustomers { edges { node { name } } } }')
+        sql = queries[0]['sql']
+        self.assertIn('"name"', sql)
+        self.assertNotIn('"address"', sql)
+
+    def test_by_id_joins_and_prefetches(self):
+        query = '''
+            query ($id: Int!) {
+                orderById(id: $id) {
+                    status
+                    customer { name }
+                    items { quantity product { name } }
+                }
+            }
+        '''
+        with self.assertNumQueries(2):
+            data = self.execute(query, {'id': self.orders[0].pk})
+        self.assertEqual(data['orderById']['customer']['name'], 'Customer 0')
+        self.assertEqual(
+            [item['product']['name'] for item in data['orderById']['items']],
+            ['Laptop', 'Mouse'],
+        )
+
+    def test_reverse_relations_without_related_name_are_prefetched(self):
+        query = 'query { allProducts { edges { node { name orderitemSet { quantity } } } } }'
+        # the products, then every product's items
+        with self.assertNumQueries(2):
+            data = self.execute(query)
+        quantities = [[item['quantity'] for item in edge['node']['orderitemSet']] for edge in data['allProducts']['edges']]
+        self.assertEqual(quantities, [[1] * 6, [2] * 6, []])
+
+    def test_fragments_are_followed(self):
+        query = '''
+            query {
+                allOrders { edges { node { ...OrderFields } } }
+            }
+            fragment OrderFields on OrderType {
+                customer { email }
+                products { name }
+            }
+        '''
+        with self.assertNumQueries(2):
+            self.execute(query)
+
+
+class BulkCreateCustomersTests(CRMTestCase):
+    mutation = '''
+        mutation ($input: [CustomerInput]!) {
+            bulkCreateCustomers(input: $input) {
+                customers { id email }
+                errors
+            }
+        }
+    '''
+
+    def test_reports_errors_per_row(self):
+        rows = [
+            {'name': 'New', 'email': 'new@example.com', 'phone': '+12345678901'},
+            {'name': 'Taken', 'email': 'customer0@example.com'},
+            {'name': 'Bad phone', 'email': 'bad@example.com', 'phone': '12'},
+            {'name': 'Repeat', 'email': 'new@example.com'},
+        ]
+        data = self.execute(self.mutation, {'input': rows})['bulkCreateCustomers']
+
+        self.assertEqual([c['email'] for c in data['customers']], ['new@example.com'])
+        self.assertTrue(data['customers'][0]['id'])
+        self.assertEqual(data['errors'], [
+            'Customer 2: Email customer0@example.com already exists',
+            'Customer 3: Invalid phone format. Use +1234567890 or 123-456-7890',
+            'Customer 4: Email new@example.com already exists',
+        ])
+
+    def test_rows_inserted_since_the_lookup_are_rejected_alone(self):
+        rows = [
+            {'name': 'First', 'email': 'first@example.com'},
+            {'name': 'Raced', 'email': 'customer1@example.com'},
+            {'name': 'Bad phone', 'email': 'bad@example.com', 'phone': '12'},
+            {'name': 'Last', 'email': 'last@example.com'},
+        ]
+        # as if customer1 had been inserted after the emails were looked up
+        with mock.patch('crm.schema.BulkCreateCustomers.existing_emails', return_value=set()):
+            data = self.execute(self.mutation, {'input': rows})['bulkCreateCustomers']
+
+        self.assertEqual([c['email'] for c in data['customers']], ['first@example.com', 'last@example.com'])
+        self.assertTrue(all(c['id'] for c in data['customers']))
+        self.assertEqual(data['errors'], [
+            'Customer 2: Email customer1@example.com already exists',
+            'Customer 3: Invalid phone format. Use +1234567890 or 123-456-7890',
+        ])
+        self.assertEqual(Customer.objects.filter(email__in=['first@example.com', 'last@example.com']).count(), 2)
+
+    def test_values_longer_than_their_columns_are_rejected(self):
+        rows = [
+            {'name': 'Long phone', 'email': 'long@example.com', 'phone': '+123456789012345'},
+            {'name': 'N' * 101, 'email': 'name@example.com'},
+            {'name': 'Fits', 'email': 'fits@example.com', 'phone': '+12345678901234'},
+        ]
+        data = self.execute(self.mutation, {'input': rows})['bulkCreateCustomers']
+
+        self.assertEqual([c['email'] for c in data['customers']], ['fits@example.com'])
+        self.assertEqual(data['errors'], [
+            'Customer 1: Phone must be at most 15 characters',
+            'Customer 2: Name must be at most 100 characters',
+        ])
+
+    def test_other_database_errors_are_reported_per_row(self):
+        rows = [{'name': 'First', 'email': 'first@example.com'}, {'name': 'Second', 'email': 'second@example.com'}]
+        save = Customer.save
+
+        def fail_second(customer, *args, **kwargs):
+            if customer.email == 'second@example.com':
+                raise DataError('value too long')
+            return save(customer, *args, **kwargs)
+
+        with mock.patch.object(Customer.objects, 'bulk_create', side_effect=DataError('value too long')), \
+                mock.patch.object(Customer, 'save', fail_second):
+            data = self.execute(self.mutation, {'input': rows})['bulkCreateCustomers']
+
+        self.assertEqual([c['email'] for c in data['customers']], ['first@example.com'])
+        self.assertEqual(data['errors'], ['Customer 2: Could not be created: value too long'])
+
+    def test_inserts_in_batches(self):
+        rows = [{'name': f'Bulk {i}', 'email': f'bulk{i}@example.com'} for i in range(25)]
+        with mock.patch('crm.schema.BULK_CREATE_BATCH_SIZE', 10):
+            with CaptureQueriesContext(connection) as queries:
+                data = self.execute(self.mutation, {'input': rows})['bulkCreateCustomers']
+
+        inserts = [q for q in queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(len(data['customers']), 25)
+        self.assertEqual(Customer.objects.filter(email__startswith='bulk').count(), 25)
+
+
+class CreateOrderTests(CRMTestCase):
+    mutation = '''
+        mutation ($input: OrderInput!) {
+            createOrder(input: $input) {
+                order { id totalAmount items { quantity product { name } } }
+            }
+        }
+    '''
+
+    def test_creates_order_with_quantities(self):
+        order_input = {
+            'customerId': self.customers[0].pk,
+            'items': [
+                {'productId': self.products[0].pk, 'quantity': 2},
+                {'productId': self.products[1].pk},
+            ],
+        }
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            data = self.execute(self.mutation, {'input': order_input})['createOrder']['order']
+
+        selects = [q for q in queries if q['sql'].startswith('SELECT')]
+        inserts = [q for q in queries if q['sql'].startswith('INSERT')]
+        # the order and its items, then one upsert per rollup table on commit
+        self.assertEqual((len(selects), len(inserts)), (2, 4))
+        self.assertAlmostEqual(data['totalAmount'], 2019.48)
+        self.assertEqual(
+            [(item['quantity'], item['product']['name']) for item in data['items']],
+            [(2, 'Laptop'), (1, 'Mouse')],
+        )
+        order = Order.objects.get(pk=data['id'])
+        self.assertEqual(order.total_amount, Decimal('2019.48'))
+        self.assertEqual(
+            sorted(order.items.values_list('unit_price', flat=True)),
+            [Decimal('19.50'), Decimal('999.99')],
+        )
+
+    def test_product_ids_still_accepted(self):
+        order_input = {'customerId': self.customers[0].pk, 'productIds': [self.products[2].pk]}
+        data = self.execute(self.mutation, {'input': order_input})['createOrder']['order']
+        self.assertAlmostEqual(data['totalAmount'], 349.99)
+
+    def test_unknown_product_is_rejected(self):
+        order_input = {'customerId': self.customers[0].pk, 'productIds': [999]}
+        response = self.query(self.mutation, variables={'input': order_input})
+        self.assertResponseHasErrors(response)
+        self.assertIn('Product with ID 999 does not exist', response.content.decode())
+
+    def test_bulk_create_orders(self):
+        mutation = '''
+            mutation ($input: [OrderInput]!) {
+                bulkCreateOrders(input: $input) { orders { id } errors }
+            }
+        '''
+        inputs = [
+            {'customerId': customer.pk, 'items': [{'productId': self.products[1].pk, 'quantity': 3}]}
+            for customer in self.customers
+        ]
+        inputs.append({'customerId': 999, 'productIds': [self.products[0].pk]})
+        data = self.execute(mutation, {'input': inputs})['bulkCreateOrders']
+
+        self.assertEqual(len(data['orders']), 3)
+        self.assertEqual(data['errors'], ['Order 4: Customer with ID 999 does not exist'])
+        self.assertEqual(OrderItem.objects.filter(quantity=3).count(), 3)
+
+
+class StockReservationTests(CRMTestCase):
+    mutation = CreateOrderTests.mutation
+
+    def order(self, product, quantity):
+        order_input = {
+            'customerId': self.customers[0].pk,
+            'items': [{'productId': product.pk, 'quantity': quantity}],
+        }
+        return self.query(self.mutation, variables={'input': order_input})
+
+    def test_order_decrements_stock(self):
+        self.assertResponseNoErrors(self.order(self.products[2], 8))
+        product = Product.objects.get(pk=self.products[2].pk)
+        self.assertEqual(product.stock, 0)
+        self.assertFalse(product.in_stock)
+
+    def test_products_without_stock_are_out_of_stock(self):
+        data = self.execute('''
+            mutation {
+                none: createProduct(input: {name: "Cable", price: 5.0}) { product { stock inStock } }
+                zero: createProduct(input: {name: "Adapter", price: 8.0, stock: 0}) { product { stock inStock } }
+                some: createProduct(input: {name: "Hub", price: 25.0, stock: 2}) { product { stock inStock } }
+            }
+        ''')
+        self.assertEqual(data['none']['product'], {'stock': 0, 'inStock': False})
+        self.assertEqual(data['zero']['product'], {'stock': 0, 'inStock': False})
+        self.assertEqual(data['some']['product'], {'stock': 2, 'inStock': True})
+
+    def test_insufficient_stock_rejects_whole_order(self):
+        order_input = {
+            'customerId': self.customers[0].pk,
+            'items': [
+                {'productId': self.products[1].pk, 'quantity': 5},
+                {'productId': self.products[2].pk, 'quantity': 9},
+            ],
+        }
+        response = self.query(self.mutation, variables={'input': order_input})
+        self.assertResponseHasErrors(response)
+        self.assertIn(f'Insufficient stock for product {self.products[2].pk}', response.content.decode())
+        self.assertEqual(Product.objects.get(pk=self.products[1].pk).stock, 50)
+        self.assertEqual(Order.objects.count(), len(self.orders))
+
+    def test_reservations_span_many_products(self):
+        products = Product.objects.bulk_create(
+            Product(name=f'Part {i}', price=Decimal('1.00'), stock=2) for i in range(1200)
+        )
+        order_inputs = [
+            SimpleNamespace(
+                customer_id=self.customers[0].pk,
+                product_ids=None,
+                items=[SimpleNamespace(product_id=product.pk, quantity=1) for product in products[start:start + 100]],
+            )
+            for start in range(0, len(products), 100)
+        ]
+        results = create_orders(order_inputs)
+        self.assertTrue(all(isinstance(result, Order) for result in results))
+        self.assertEqual(set(Product.objects.filter(name__startswith='Part').values_list('stock', flat=True)), {1})
+
+    def test_reservation_rolls_back_earlier_batches(self):
+        products = Product.objects.bulk_create(
+            Product(name=f'Part {i}', price=Decimal('1.00'), stock=1) for i in range(1000)
+        )
+        quantities = {product.pk: 1 for product in products}
+        # the last product, in the last batch, is short
+        quantities[products[-1].pk] = 2
+        self.assertFalse(Product.objects.reserve_stock(quantities))
+        self.assertEqual(set(Product.objects.filter(name__startswith='Part').values_list('stock', flat=True)), {1})
+
+    def test_bulk_orders_keep_those_that_fit(self):
+        mutation = '''
+            mutation ($input: [OrderInput]!) {
+                bulkCreateOrders(input: $input) { orders { id } errors }
+            }
+        '''
+        line = {'productId': self.products[2].pk, 'quantity': 5}
+        inputs = [{'customerId': customer.pk, 'items': [line]} for customer in self.customers[:2]]
+        data = self.execute(mutation, {'input': inputs})['bulkCreateOrders']
+
+        self.assertEqual(len(data['orders']), 1)
+        self.assertEqual(data['errors'], [f'Order 2: Insufficient stock for product {self.products[2].pk}'])
+        self.assertEqual(Product.objects.get(pk=self.products[2].pk).stock, 3)
+
+
+class StockContentionTests(TransactionTestCase):
+    threads = 12
+    stock = 5
+
+    def test_hot_product_is_never_oversold(self):
+        customer = Customer.objects.create(name='Buyer', email='buyer@example.com')
+        product = Product.objects.create(name='Hot', price=Decimal('1.00'), stock=self.stock)
+        order_input = SimpleNamespace(
+            customer_id=customer.pk,
+            product_ids=None,
+            items=[SimpleNamespace(product_id=product.pk, quantity=1)],
+        )
+        start = threading.Barrier(self.threads)
+        outcomes = []
+
+        def buy():
+            start.wait()
+            try:
+                for _ in range(50):
+                    try:
+                        (result,) = create_orders([order_input])
+                        outcomes.append(result)
+                        return
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting
+                        time.sleep(0.01)
+                outcomes.append(None)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=buy) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        product.refresh_from_db()
+        sold = sum(isinstance(outcome, Order) for outcome in outcomes)
+        self.assertEqual(sold, self.stock)
+        # every other buyer was told why, none ran out of retries
+        self.assertEqual(
+            [outcome.message for outcome in outcomes if not isinstance(outcome, Order)],
+            [f'Insufficient stock for product {product.pk}'] * (self.threads - self.stock),
+        )
+        self.assertEqual(product.stock, 0)
+        self.assertFalse(product.in_stock)
+        self.assertEqual(OrderItem.objects.filter(product=product).count(), sold)
+
+    def test_checkouts_leave_the_rollups_until_commit(self):
+        customer = Customer.objects.create(name='Buyer', email='buyer@example.com')
+        product = Product.objects.create(name='Hot', price=Decimal('1.00'), stock=self.stock)
+        order_input = SimpleNamespace(
+            customer_id=customer.pk,
+            product_ids=None,
+            items=[SimpleNamespace(product_id=product.pk, quantity=1)],
+        )
+        with CaptureQueriesContext(connection) as queries:
+            create_orders([order_input, order_input])
+
+        statements = [query['sql'] for query in queries.captured_queries]
+        checkout = statements[:statements.index('COMMIT')]
+        # the shared (today, 'pending') row is never locked while a checkout
+        # holds its stock rows, so checkouts don't queue behind each other on it
+        self.assertTrue(any('crm_orderitem' in sql for sql in checkout))
+        self.assertFalse(any('summary' in sql for sql in checkout))
+        self.assertEqual(OrderDailySummary.objects.get().order_count, 2)
+        self.assertEqual(CustomerOrderSummary.objects.get(customer=customer).revenue, Decimal('2.00'))
+
+
+class DocumentCacheTests(CRMTestCase):
+    def setUp(self):
+        document_cache.clear()
+        cache.clear()
+
+    def post(self, body):
+        response = self.client.post(self.GRAPHQL_URL, json.dumps(body), content_type='application/json')
+        return json.loads(response.content)
+
+    def test_documents_are_parsed_once(self):
+        query = 'query { allProducts { totalCount } }'
+        with mock.patch('crm.views.parse', wraps=parse) as parse_spy:
+            for _ in range(3):
+                self.assertEqual(self.post({'query': query})['data']['allProducts']['totalCount'], 3)
+        self.assertEqual(parse_spy.call_count, 1)
+
+    def test_invalid_documents_keep_failing(self):
+        for _ in range(2):
+            self.assertIn('errors', self.post({'query': 'query { noSuchField }'}))
+
+    def test_automatic_persisted_query(self):
+        query = 'query { allCustomers { totalCount } }'
+        extensions = {'persistedQuery': {'version': 1, 'sha256Hash': hashlib.sha256(query.encode()).hexdigest()}}
+
+        missing = self.post({'extensions': extensions})
+        self.assertEqual(missing['errors'][0]['message'], 'PersistedQueryNotFound')
+
+        registered = self.post({'query': query, 'extensions': extensions})
+        self.assertEqual(registered['data']['allCustomers']['totalCount'], 3)
+
+        by_hash = self.post({'extensions': extensions})
+        self.assertEqual(by_hash['data']['allCustomers']['totalCount'], 3)
+
+    def test_extensions_must_be_objects(self):
+        for extensions, message in [
+            (['x'], 'Extensions must be an object.'),
+            (json.dumps(['x']), 'Extensions must be an object.'),
+            ({'persistedQuery': 'abc'}, 'The persistedQuery extension must be an object.'),
+        ]:
+            with self.subTest(extensions=extensions):
+                response = self.post({'query': 'query { hello }', 'extensions': extensions})
+                self.assertEqual(response['errors'][0]['message'], message)
+
+    def test_mismatched_hash_is_rejected(self):
+        extensions = {'persistedQuery': {'version': 1, 'sha256Hash': '0' * 64}}
+        response = self.post({'query': 'query { hello }', 'extensions': extensions})
+        self.assertEqual(response['errors'][0]['message'], 'Provided sha256Hash does not match query.')
+
+
+@override_settings(CRM_RESPONSE_CACHE_TIMEOUT=60)
+class ResponseCacheTests(CRMTestCase):
+    products_query = 'query { allProducts { edges { node { name stock } } } }'
+
+    def setUp(self):
+        cache.clear()
+        document_cache.clear()
+
+    def product_names(self):
+        data = self.execute(self.products_query)
+        return [edge['node']['name'] for edge in data['allProducts']['edges']]
+
+    def test_repeated_query_is_served_from_cache(self):
+        self.product_names()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.product_names(), ['Laptop', 'Mouse', 'Monitor'])
+
+    def test_saving_a_model_invalidates(self):
+        self.product_names()
+        Product.objects.create(name='Cable', price=Decimal('5.00'))
+        self.assertEqual(self.product_names(), ['Laptop', 'Mouse', 'Monitor', 'Cable'])
+
+    def test_stock_reservation_invalidates(self):
+        self.product_names()
+        self.execute(CreateOrderTests.mutation, {'input': {
+            'customerId': self.customers[0].pk,
+            'items': [{'productId': self.products[2].pk, 'quantity': 3}],
+        }})
+        data = self.execute(self.products_query)
+        self.assertEqual(data['allProducts']['edges'][2]['node']['stock'], 5)
+
+    def test_models_are_invalidated_once_per_transaction(self):
+        with mock.patch('crm.cache._bump', wraps=cache_module._bump) as bump:
+            with self.captureOnCommitCallbacks() as callbacks:
+                with transaction.atomic():
+                    Customer.objects.filter(pk=self.customers[0].pk).delete()
+                    Product.objects.create(name='Cable', price=Decimal('5.00'))
+        # the customer, its orders, their items and its rollup, plus the product
+        bumped = [model for call in bump.call_args_list for model in call.args[0]]
+        self.assertEqual(len(bumped), len(set(bumped)))
+        self.assertIn(OrderItem, bumped)
+        pending = [getattr(callback, '__self__', None) for callback in callbacks]
+        self.assertEqual(sum(isinstance(work, cache_module._PendingInvalidation) for work in pending), 1)
+
+    @override_settings(CRM_RESPONSE_CACHE_TIMEOUT=0)
+    def test_writes_leave_the_cache_alone_while_disabled(self):
+        with mock.patch('crm.cache._cache') as response_cache:
+            Customer.objects.create(name='New', email='new@example.com')
+            self.product_names()
+        response_cache.assert_not_called()
+
+    def test_fields_not_opted_in_are_not_cached(self):
+        query = 'query { allOrders { totalCount } }'
+        self.execute(query)
+        # the page and its count, again
+        with self.assertNumQueries(2):
+            self.execute(query)
+
+    def test_waiters_reuse_the_first_result(self):
+        key = 'crm:response:test'
+        cache.add(f'{key}:lock', 1)
+        threading.Timer(0.1, lambda: cache.set(key, {'hello': 'cached'})).start()
+
+        execute = mock.Mock()
+        result = get_or_execute(key, execute)
+
+        self.assertEqual(result.data, {'hello': 'cached'})
+        execute.assert_not_called()
+
+
+class QueryComplexityTests(CRMTestCase):
+    def setUp(self):
+        document_cache.clear()
+
+    def errors(self, query):
+        response = self.client.post(self.GRAPHQL_URL, json.dumps({'query': query}), content_type='application/json')
+        return [error['message'] for error in json.loads(response.content).get('errors', [])]
+
+    def test_nested_lists_exceed_cost(self):
+        query = '''
+            query {
+                allCustomers {
+                    edges { node { orders { products { name } items { product { name } } } } }
+                }
+            }
+        '''
+        self.assertEqual(self.errors(query), ['Query cost of 124101 exceeds the maximum of 50000.'])
+
+    def test_unpaginated_nested_lists_within_cost(self):
+        query = '''
+            query {
+                allCustomers { edges { node { orders { products { name } } } } }
+            }
+        '''
+        self.assertEqual(self.errors(query), [])
+
+    def test_page_size_lowers_cost(self):
+        query = '''
+            query {
+                allOrders(first: 5) {
+                    edges { node { products { name } customer { orders { items { quantity } } } } }
+                }
+            }
+        '''
+        self.assertEqual(self.errors(query), [])
+
+    @override_settings(CRM_GRAPHQL_MAX_DEPTH=3)
+    def test_depth_limit(self):
+        query = 'query { orderById(id: 1) { customer { orders { id } } } }'
+        self.assertEqual(self.errors(query), ['Query depth of 4 exceeds the maximum of 3.'])
+
+    def test_cyclic_fragments_are_reported_not_followed(self):
+        query = '''
+            query { orderById(id: 1) { ...A } }
+            fragment A on OrderType { customer { orders { ...A } } }
+        '''
+        errors = self.errors(query)
+        self.assertIn("Cannot spread fragment 'A' within itself.", errors)
+        self.assertIn('Query depth of 11 exceeds the maximum of 10.', errors)
+
+
+class AsyncViewTests(CRMTestCase):
+    async def post_async(self, query, variables=None):
+        response = await self.async_client.post(
+            '/graphql/async',
+            json.dumps({'query': query, 'variables': variables}),
+            content_type='application/json',
+        )
+        return response.status_code, json.loads(response.content)
+
+    async def test_query_fields_resolve_asynchronously(self):
+        status, body = await self.post_async('''
+            query {
+                hello
+                allOrders(first: 2) {
+                    totalCount
+                    edges { node { id totalAmount customer { email } items { quantity product { name } } } }
+                    pageInfo { hasNextPage }
+                }
+                customerById(id: %d) { email orders { id } }
+                productById(id: 0) { name }
+                pendingOrdersLastWeek { id }
+            }
+        ''' % self.customers[0].pk)
+        self.assertEqual(status, 200, body)
+        data = body['data']
+        self.assertEqual(data['hello'], 'Hello, GraphQL!')
+        self.assertEqual(data['allOrders']['totalCount'], 6)
+        self.assertTrue(data['allOrders']['pageInfo']['hasNextPage'])
+        node = data['allOrders']['edges'][0]['node']
+        self.assertAlmostEqual(node['totalAmount'], 1038.99)
+        self.assertEqual(node['customer']['email'], 'customer0@example.com')
+        self.assertEqual([item['product']['name'] for item in node['items']], ['Laptop', 'Mouse'])
+        self.assertEqual(len(data['customerById']['orders']), 2)
+        self.assertIsNone(data['productById'])
+        self.assertEqual(len(data['pendingOrdersLastWeek']), 6)
+
+    async def test_mutations_run_through_the_sync_path(self):
+        status, body = await self.post_async('''
+            mutation {
+                createProduct(input: {name: "Keyboard", price: 49.0, stock: 3}) { product { name stock } }
+            }
+        ''')
+        self.assertEqual(status, 200, body)
+        self.assertEqual(body['data']['createProduct']['product'], {'name': 'Keyboard', 'stock': 3})
+        self.assertTrue(await Product.objects.filter(name='Keyboard').aexists())
+
+    async def test_validation_errors(self):
+        status, body = await self.post_async('query { noSuchField }')
+        self.assertEqual(status, 400)
+        self.assertIn('noSuchField', body['errors'][0]['message'])
+
+    async def test_nested_fields_are_awaited_from_loaders(self):
+        query = '''
+            query Unplanned {
+                allOrders(first: 6) {
+                    edges { node { customer { email orders { id } } products { name } items { quantity } } }
+                }
+            }
+        '''
+        # without the optimizer's preloads every relationship goes through a loader
+        with mock.patch('crm.schema.optimize', side_effect=lambda queryset, info: queryset):
+            status, body = await self.post_async(query)
+        self.assertEqual(status, 200, body)
+        nodes = [edge['node'] for edge in body['data']['allOrders']['edges']]
+        self.assertEqual([node['customer']['email'] for node in nodes[::2]], [
+            'customer0@example.com', 'customer1@example.com', 'customer2@example.com',
+        ])
+        self.assertTrue(all(len(node['customer']['orders']) == 2 for node in nodes))
+        self.assertTrue(all([p['name'] for p in node['products']] == ['Laptop', 'Mouse'] for node in nodes))
+        # the page, then customers, their orders, items and products once each
+        self.assertEqual(metrics.snapshot()['operations']['Unplanned']['queries']['total'], 5)
+
+    async def test_reverse_relations_are_preloaded(self):
+        status, body = await self.post_async(
+            'query { allProducts(first: 2) { edges { node { name orderitemSet { quantity } } } } }'
+        )
+        self.assertEqual(status, 200, body)
+        self.assertEqual(
+            [len(edge['node']['orderitemSet']) for edge in body['data']['allProducts']['edges']], [6, 6]
+        )
+
+    async def test_batches_are_rejected(self):
+        response = await self.async_client.post(
+            '/graphql/async', json.dumps([{'query': '{ hello }'}]), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('only accepted by /graphql', json.loads(response.content)['errors'][0]['message'])
+
+
+class ExportOrdersTests(CRMTestCase):
+    def export(self, *args):
+        output = StringIO()
+        call_command('export_orders', *args, '--chunk-size', '2', stdout=output, stderr=StringIO())
+        return [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_rows_include_customer_and_total(self):
+        rows = self.export()
+        self.assertEqual([row['id'] for row in rows], [order.pk for order in self.orders])
+        self.assertEqual(rows[0]['customer']['email'], 'customer0@example.com')
+        self.assertEqual(rows[0]['total_amount'], '1038.99')
+
+    def test_filters(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(status='delivered')
+        self.assertEqual([row['id'] for row in self.export('--status', 'delivered')], [self.orders[0].pk])
+        self.assertEqual(self.export('--since', '2999-01-01'), [])
+
+    def test_streams_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.export()
+
+
+class CleanupInactiveCustomersTests(CRMTestCase):
+    def setUp(self):
+        # customer 0 last ordered two years ago, customer 1 never ordered
+        Order.objects.filter(customer=self.customers[0]).update(
+            date_ordered=timezone.now() - timedelta(days=730)
+        )
+        Order.objects.filter(customer=self.customers[1]).delete()
+
+    def cleanup(self, *args):
+        output = StringIO()
+        call_command('cleanup_inactive_customers', *args, stdout=output)
+        return output.getvalue()
+
+    def test_dry_run_deletes_nothing(self):
+        output = self.cleanup('--dry-run')
+        self.assertIn('Would delete 2 inactive customers', output)
+        self.assertEqual(Customer.objects.count(), 3)
+
+    def test_deletes_inactive_customers_in_batches(self):
+        output = self.cleanup('--batch-size', '1')
+        self.assertIn('Deleted 2 inactive customers', output)
+        self.assertEqual(list(Customer.objects.all()), [self.customers[2]])
+        self.assertFalse(Order.objects.filter(customer_id=self.customers[0].pk).exists())
+        self.assertEqual(OrderItem.objects.count(), 4)
+
+
+class SendOrderRemindersTests(CRMTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log_file = os.path.join(directory.name, 'reminders.log')
+        self.state_file = os.path.join(directory.name, 'state.json')
+
+    def remind(self):
+        call_command(
+            'send_order_reminders',
+            '--log-file', self.log_file,
+            '--state-file', self.state_file,
+            '--batch-size', '4',
+            stdout=StringIO(),
+        )
+        with open(self.log_file) as log:
+            return log.read().splitlines()
+
+    def test_orders_are_reminded_once(self):
+        lines = self.remind()
+        self.assertEqual(len(lines), 6)
+        self.assertIn(f'Order ID {self.orders[0].pk} - Customer: Customer 0 (customer0@example.com)', lines[0])
+
+        new_order = Order.objects.create(customer=self.customers[1])
+        lines = self.remind()[6:]
+        self.assertEqual(len(lines), 1)
+        self.assertIn(f'Order ID {new_order.pk} ', lines[0])
+
+        self.assertIn('No new pending orders', self.remind()[-1])
+
+    def test_reads_orders_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.remind()
+
+
+class HealthAndMetricsTests(CRMTestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_healthz(self):
+        response = self.client.get('/healthz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['database'], 'ok')
+        self.assertEqual(response.json()['schema'], 'ok')
+
+    def test_healthz_reports_database_failure(self):
+        with mock.patch.object(connection, 'cursor', side_effect=OperationalError('down')):
+            response = self.client.get('/healthz')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['database'], 'error: down')
+
+    def test_operations_are_recorded(self):
+        for _ in range(2):
+            self.execute('query Orders { allOrders(first: 2) { edges { node { id } } } }')
+        self.query('{ noSuchField }')
+
+        snapshot = self.client.get('/metrics').json()
+        self.assertEqual(snapshot['requests'], 3)
+        self.assertEqual(snapshot['errors'], 1)
+        orders = snapshot['operations']['Orders']
+        self.assertEqual(orders['requests'], 2)
+        self.assertEqual(orders['queries']['max'], 1)
+        self.assertEqual(sum(orders['latency_ms']['buckets'].values()), 2)
+        self.assertEqual(snapshot['operations']['<anonymous>']['errors'], 1)
+
+    async def test_async_operations_count_queries(self):
+        await self.async_client.post(
+            '/graphql/async',
+            json.dumps({'query': 'query Page { allOrders(first: 2) { totalCount edges { node { id } } } }'}),
+            content_type='application/json',
+        )
+        # the page and its count
+        self.assertEqual(metrics.snapshot()['operations']['Page']['queries']['total'], 2)
+
+
+class HeartbeatTests(SimpleTestCase):
+    def heartbeat(self, error):
+        log = mock.mock_open()
+        with mock.patch('crm.cron.urllib.request.urlopen', side_effect=error), \
+                mock.patch('crm.cron.open', log, create=True):
+            log_crm_heartbeat()
+        return ''.join(log().writelines.call_args.args[0])
+
+    def test_unhealthy_response_is_logged(self):
+        body = json.dumps({'status': 'error', 'database': 'error: locked', 'schema': 'ok'})
+        error = urllib.error.HTTPError(HEALTHZ_URL, 503, 'Service Unavailable', {}, BytesIO(body.encode()))
+        self.assertIn('Health: error (database: error: locked, schema: ok', self.heartbeat(error))
+
+    def test_non_json_error_logs_the_status(self):
+        error = urllib.error.HTTPError(HEALTHZ_URL, 502, 'Bad Gateway', {}, BytesIO(b'<html>Bad Gateway</html>'))
+        lines = self.heartbeat(error)
+        self.assertIn('CRM is alive', lines)
+        self.assertIn('Health endpoint error: HTTP 502', lines)
+
+
+class ResolverProfilingTests(CRMTestCase):
+    orders_query = '''
+        query Orders {
+            allOrders(first: 2) { edges { node { id customer { email } products { name } } } }
+        }
+    '''
+
+    def setUp(self):
+        metrics.reset()
+
+    @override_settings(CRM_RESOLVER_PROFILE_RATE=1, DEBUG=True)
+    def test_sampled_operations_report_resolvers(self):
+        response = self.query(self.orders_query)
+        self.assertResponseNoErrors(response)
+        resolvers = json.loads(response.content)['extensions']['resolvers']
+
+        # the page, then the items and products prefetched for it
+        self.assertEqual(resolvers['allOrders']['queries'], 2)
+        self.assertEqual(resolvers['allOrders.edges.node.products']['calls'], 2)
+        self.assertEqual(resolvers['allOrders.edges.node.products']['queries'], 0)
+        self.assertEqual(
+            metrics.snapshot()['operations']['Orders']['resolvers']['allOrders.edges.node.customer']['calls'], 2
+        )
+
+    @override_settings(CRM_RESOLVER_PROFILE_RATE=1, DEBUG=False)
+    def test_extensions_only_in_debug(self):
+        response = self.query(self.orders_query)
+        self.assertNotIn('extensions', json.loads(response.content))
+        self.assertIn('allOrders', metrics.snapshot()['operations']['Orders']['resolvers'])
+
+    def test_unsampled_operations_are_not_profiled(self):
+        self.query(self.orders_query)
+        self.assertEqual(metrics.snapshot()['operations']['Orders']['resolvers'], {})
+
+
+class ListFilterTests(CRMTestCase):
+    def names(self, query, variables=None):
+        data = self.execute(query, variables)
+        connection = next(iter(data.values()))
+        return [edge['node']['name'] for edge in connection['edges']]
+
+    def test_product_filters(self):
+        Product.objects.create(name='Mousepad', price=Decimal('9.99'), stock=0, in_stock=False)
+        query = '''
+            query($prefix: String, $min: Decimal, $max: Decimal, $inStock: Boolean) {
+                allProducts(namePrefix: $prefix, minPrice: $min, maxPrice: $max, inStock: $inStock) {
+                    edges { node { name } }
+                }
+            }
+        '''
+        self.assertEqual(self.names(query, {'prefix': 'Mo'}), ['Mouse', 'Monitor', 'Mousepad'])
+        self.assertEqual(self.names(query, {'prefix': 'mo'}), [])
+        self.assertEqual(self.names(query, {'min': '19.50', 'max': '500'}), ['Mouse', 'Monitor'])
+        self.assertEqual(self.names(query, {'prefix': 'Mo', 'inStock': False}), ['Mousepad'])
+
+    def test_prefixes_ending_in_the_last_characters_before_a_gap(self):
+        Product.objects.create(name='Mo\U0010ffff', price=Decimal('1.00'))
+        Product.objects.create(name='Mo\ud7ff\ue000', price=Decimal('1.00'))
+        query = 'query($prefix: String) { allProducts(namePrefix: $prefix) { edges { node { name } } } }'
+        self.assertEqual(self.names(query, {'prefix': 'Mo\U0010ffff'}), ['Mo\U0010ffff'])
+        self.assertEqual(self.names(query, {'prefix': 'Mo\ud7ff'}), ['Mo\ud7ff\ue000'])
+
+    def test_order_filters(self):
+        Order.objects.filter(pk=self.orders[1].pk).update(status='delivered')
+        Order.objects.filter(pk=self.orders[2].pk).update(date_ordered=timezone.now() - timedelta(days=30))
+        query = '''
+            query($status: String, $customer: Int, $from: DateTime) {
+                allOrders(status: $status, customer: $customer, dateFrom: $from) { edges { node { id } } }
+            }
+        '''
+        ids = lambda variables: [int(edge['node']['id']) for edge in self.execute(query, variables)['allOrders']['edges']]
+        self.assertEqual(ids({'status': 'delivered'}), [self.orders[1].pk])
+        self.assertEqual(ids({'customer': self.customers[1].pk}), [self.orders[2].pk, self.orders[3].pk])
+        since = (timezone.now() - timedelta(days=7)).isoformat()
+        self.assertNotIn(self.orders[2].pk, ids({'from': since}))
+
+    def test_customer_email_prefix(self):
+        query = '{ allCustomers(emailPrefix: "customer1@") { edges { node { name } } } }'
+        self.assertEqual(self.names(query), ['Customer 1'])
+
+    def test_invalid_filter_value(self):
+        response = self.query('{ allOrders(status: "lost") { edges { node { id } } } }')
+        self.assertIn('Invalid filters: status:', json.loads(response.content)['errors'][0]['message'])
+
+    def test_ordering_pages_through_ties(self):
+        Product.objects.create(name='Cable', price=Decimal('19.50'), stock=5)
+        query = '''
+            query($after: String) {
+                allProducts(orderBy: PRICE_DESC, first: 2, after: $after) {
+                    edges { node { name } }
+                    pageInfo { endCursor hasNextPage }
+                }
+            }
+        '''
+        names = []
+        after = None
+        while True:
+            connection = self.execute(query, {'after': after})['allProducts']
+            names += [edge['node']['name'] for edge in connection['edges']]
+            if not connection['pageInfo']['hasNextPage']:
+                break
+            after = connection['pageInfo']['endCursor']
+        # equal prices fall back to descending ids
+        self.assertEqual(names, ['Laptop', 'Monitor', 'Cable', 'Mouse'])
+
+    def test_ordering_cursor_mismatch(self):
+        after = self.execute('{ allProducts(first: 1) { pageInfo { endCursor } } }')['allProducts']['pageInfo']['endCursor']
+        response = self.query(
+            'query($after: String) { allProducts(orderBy: NAME_ASC, after: $after) { edges { node { name } } } }',
+            variables={'after': after},
+        )
+        self.assertIn('Invalid cursor', json.loads(response.content)['errors'][0]['message'])
+
+    def test_ordering_by_date(self):
+        query = '''
+            query($after: String) {
+                allOrders(orderBy: DATE_ORDERED_DESC, first: 4, after: $after) {
+                    edges { node { id } }
+                    pageInfo { endCursor }
+                }
+            }
+        '''
+        first = self.execute(query)['allOrders']
+        second = self.execute(query, {'after': first['pageInfo']['endCursor']})['allOrders']
+        ids = [int(edge['node']['id']) for edge in first['edges'] + second['edges']]
+        self.assertEqual(ids, [order.pk for order in reversed(self.orders)])
+
+
+class OrderSummaryTests(CRMTestCase):
+    summaries_query = '''
+        query {
+            dailyOrderSummaries { day status orderCount revenue }
+            topCustomers(first: 2) { customer { email } orderCount revenue }
+        }
+    '''
+
+    def setUp(self):
+        rebuild_summaries()
+
+    def daily(self):
+        return {
+            summary.status: (summary.order_count, summary.revenue)
+            for summary in OrderDailySummary.objects.all()
+        }
+
+    def test_rebuild_and_query(self):
+        data = self.execute(self.summaries_query)
+        [summary] = data['dailyOrderSummaries']
+        self.assertEqual((summary['status'], summary['orderCount']), ('PENDING', 6))
+        self.assertAlmostEqual(float(summary['revenue']), 6 * 1038.99)
+        self.assertEqual(len(data['topCustomers']), 2)
+        self.assertEqual(data['topCustomers'][0]['orderCount'], 2)
+
+    def test_new_orders_are_added_in_place(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_orders([SimpleNamespace(
+                customer_id=self.customers[2].pk, product_ids=None, items=[SimpleNamespace(product_id=self.products[2].pk, quantity=2)],
+            )])
+        self.assertEqual(self.daily()['pending'], (7, Decimal('6933.92')))
+        summary = CustomerOrderSummary.objects.get(customer=self.customers[2])
+        self.assertEqual((summary.order_count, summary.revenue), (3, Decimal('2777.96')))
+
+    def test_updates_and_deletes_apply_deltas(self):
+        order = Order.objects.get(pk=self.orders[0].pk)
+        order.status = 'delivered'
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        self.assertEqual(self.daily(), {
+            'pending': (5, Decimal('5194.95')),
+            'delivered': (1, Decimal('1038.99')),
+        })
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.orders[1].items.filter(product=self.products[1]).delete()
+            self.customers[2].delete()
+        self.assertEqual(self.daily()['pending'], (3, Decimal('3077.97')))
+        self.assertFalse(CustomerOrderSummary.objects.filter(customer_id=self.customers[2].pk).exists())
+        self.assertEqual(CustomerOrderSummary.objects.get(customer=self.customers[0]).revenue, Decimal('2038.98'))
+
+    def test_item_changes_update_rows_in_place(self):
+        summary_pks = set(OrderDailySummary.objects.values_list('pk', flat=True))
+        item = self.orders[0].items.get(product=self.products[1])
+        item.quantity = 4
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+
+        self.assertEqual(set(OrderDailySummary.objects.values_list('pk', flat=True)), summary_pks)
+        self.assertEqual(self.daily()['pending'], (6, Decimal('6272.94')))
+        summary = CustomerOrderSummary.objects.get(customer=self.customers[0])
+        self.assertEqual((summary.order_count, summary.revenue), (2, Decimal('2116.98')))
+
+    def test_rebuild_command(self):
+        OrderDailySummary.objects.all().delete()
+        output = StringIO()
+        call_command('rebuild_order_summaries', stdout=output)
+        self.assertIn('Rebuilt 1 daily and 3 customer summaries', output.getvalue())
+        self.assertEqual(self.daily()['pending'][0], 6)
+
+
+class OrderSummaryAutocommitTests(TransactionTestCase):
+    """
+    Outside a transaction, on_commit callbacks run as soon as they are
+    registered, i.e. in the middle of the signal handlers.
+    """
+
+    def assertRollupsMatchOrders(self):
+        revenue = Order.objects.aggregate(total=Sum('total_amount'))['total']
+        self.assertEqual(OrderDailySummary.objects.aggregate(total=Sum('revenue'))['total'], revenue)
+        self.assertEqual(CustomerOrderSummary.objects.aggregate(total=Sum('revenue'))['total'], revenue)
+
+    def test_item_saves_refresh_the_total_before_the_rollups(self):
+        customer = Customer.objects.create(name='Walk-in', email='walkin@example.com')
+        product = Product.objects.create(name='Lamp', price=Decimal('20.00'), stock=5)
+        order = Order.objects.create(customer=customer)
+
+        item = OrderItem.objects.create(order=order, product=product, quantity=1)
+        self.assertEqual(Order.objects.get(pk=order.pk).total_amount, Decimal('20.00'))
+        self.assertRollupsMatchOrders()
+
+        item.quantity = 3
+        item.save()
+        self.assertRollupsMatchOrders()
+
+        item.delete()
+        self.assertRollupsMatchOrders()
+
+
+class CacheProfileTests(SimpleTestCase):
+    def test_local_memory_is_the_default(self):
+        config = cache_config({})
+        self.assertEqual(config['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+
+    def test_redis_location(self):
+        config = cache_config({'CRM_CACHE_BACKEND': 'redis'})
+        self.assertEqual(config['BACKEND'], 'django.core.cache.backends.redis.RedisCache')
+        self.assertEqual(config['LOCATION'], 'redis://127.0.0.1:6379/0')
+
+    def test_memcached_location(self):
+        config = cache_config({'CRM_CACHE_BACKEND': 'memcached', 'CRM_CACHE_LOCATION': 'cache:11211'})
+        self.assertEqual(config['BACKEND'], 'django.core.cache.backends.memcached.PyMemcacheCache')
+        self.assertEqual(config['LOCATION'], 'cache:11211')
+
+    def test_unknown_backend_is_rejected(self):
+        with self.assertRaises(ValueError):
+            cache_config({'CRM_CACHE_BACKEND': 'filesystem'})
+
+
+class DatabaseProfileTests(SimpleTestCase):
+    def test_sqlite_profile_tunes_connections(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = database_config({}, Path(directory))
+            handler = ConnectionHandler({'default': {}, 'profile': config})
+            try:
+                with handler['profile'].cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertEqual(cursor.fetchone()[0], 20000)
+            finally:
+                handler.close_all()
+
+    def test_sqlite_replicas_are_opened_read_only(self):
+        replicas = replica_configs({'CRM_DB_REPLICA_NAMES': '/data/a.sqlite3, /data/b c.sqlite3'}, None)
+        self.assertEqual(
+            [config['NAME'] for config in replicas.values()],
+            ['file:///data/a.sqlite3?mode=ro', 'file:///data/b%20c.sqlite3?mode=ro'],
+        )
+        self.assertEqual(replicas['replica_1']['OPTIONS'], {})
+        self.assertEqual(replicas['replica_1']['TEST'], {'MIRROR': 'default'})
+
+    def test_postgresql_replicas_are_read_only(self):
+        replicas = replica_configs({'CRM_DB_ENGINE': 'postgresql', 'CRM_DB_REPLICA_HOSTS': 'db-1,db-2'}, None)
+        self.assertEqual([config['HOST'] for config in replicas.values()], ['db-1', 'db-2'])
+        self.assertEqual(replicas['replica_2']['OPTIONS']['options'], '-c default_transaction_read_only=on')
+
+    def test_postgresql_profile_pools_connections(self):
+        config = database_config({'CRM_DB_ENGINE': 'postgresql', 'CRM_DB_POOL_MAX_SIZE': '20'}, None)
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+        self.assertEqual(config['OPTIONS']['pool'], {'min_size': 2, 'max_size': 20, 'timeout': 10})
+
+    def test_postgresql_profile_without_pool_keeps_connections(self):
+        config = database_config({'CRM_DB_ENGINE': 'postgresql', 'CRM_DB_POOL_MAX_SIZE': '0'}, None)
+        self.assertEqual(config['CONN_MAX_AGE'], 60)
+        self.assertTrue(config['CONN_HEALTH_CHECKS'])
+        self.assertNotIn('pool', config['OPTIONS'])
+
+    def test_unknown_engine_is_rejected(self):
+        with self.assertRaises(ValueError):
+            database_config({'CRM_DB_ENGINE': 'oracle'}, None)
+
+    def test_invalid_numbers_name_the_variable(self):
+        with self.assertRaisesMessage(ValueError, "CRM_DB_POOL_MAX_SIZE must be an integer, got 'ten'."):
+            database_config({'CRM_DB_ENGINE': 'postgresql', 'CRM_DB_POOL_MAX_SIZE': 'ten'}, None)
+
+
+class ReplicaRoutingTests(CRMTestCase):
+    """
+    A second SQLite file, migrated but empty, stands in for a replica that
+    has not caught up with the fixtures yet.
+    """
+
+    alias = 'replica_1'
+    count_query = 'query { allProducts { totalCount } }'
+
+    @classmethod
+    def register(cls, config):
+        config = ConnectionHandler({'default': {}, cls.alias: config}).settings[cls.alias]
+        # registered for this thread only, outside DATABASES and the test transactions
+        setattr(connections._connections, cls.alias, load_backend(config['ENGINE']).DatabaseWrapper(config, cls.alias))
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.directory.name, 'replica.sqlite3')
+        # replica connections are read-only, so the file is migrated as a primary
+        cls.register(database_config({'CRM_DB_NAME': path}, None))
+        call_command('migrate', database=cls.alias, verbosity=0)
+        connections[cls.alias].close()
+        cls.register(replica_configs({'CRM_DB_REPLICA_NAMES': path}, None)[cls.alias])
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[cls.alias].close()
+        del connections[cls.alias]
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def product_count(self):
+        return self.execute(self.count_query)['allProducts']['totalCount']
+
+    def test_queries_read_from_replicas(self):
+        self.assertEqual(self.product_count(), 3)
+        with override_settings(CRM_DB_REPLICAS=[self.alias]):
+            self.assertEqual(self.product_count(), 0)
+        # outside GraphQL queries, reads stay on the primary
+        self.assertEqual(Product.objects.count(), 3)
+
+    def test_replica_connections_are_read_only(self):
+        with self.assertRaisesMessage(OperationalError, 'readonly'):
+            Product.objects.using(self.alias).create(name='Cable', price=Decimal('5.00'))
+
+    @override_settings(CRM_RESPONSE_CACHE_TIMEOUT=60)
+    def test_replica_reads_are_not_cached(self):
+        cache.clear()
+        with override_settings(CRM_DB_REPLICAS=[self.alias]):
+            self.assertEqual(self.product_count(), 0)
+        self.assertEqual(self.product_count(), 3)
+        # what the primary read is served to replica queries as well
+        with override_settings(CRM_DB_REPLICAS=[self.alias]), self.assertNumQueries(0):
+            self.assertEqual(self.product_count(), 3)
+
+    def test_mutations_pin_the_client_to_the_primary(self):
+        mutation = 'mutation { createProduct(input: {name: "Cable", price: 5.0}) { product { id } } }'
+        with override_settings(CRM_DB_REPLICAS=[self.alias], CRM_DB_STICKY_SECONDS=5):
+            response = self.query(mutation)
+            self.assertResponseNoErrors(response)
+            self.assertEqual(response.cookies['crm_primary']['max-age'], 5)
+            self.assertEqual(Product.objects.count(), 4)
+
+            self.assertEqual(self.product_count(), 4)
+            # once the cookie expires, reads go back to the replica
+            self.client.cookies.pop('crm_primary')
+            self.assertEqual(self.product_count(), 0)
+
+    async def test_async_queries_read_from_replicas(self):
+        with override_settings(CRM_DB_REPLICAS=[self.alias]):
+            response = await self.async_client.post(
+                '/graphql/async',
+                json.dumps({'query': self.count_query}),
+                content_type='application/json',
+            )
+        self.assertEqual(json.loads(response.content)['data']['allProducts']['totalCount'], 0)
+
+
+class BatchRequestTests(CRMTestCase):
+    customer_query = '''
+        query ($id: Int!) {
+            customerById(id: $id) { email orders { items { quantity product { name stock } } } }
+        }
+    '''
+
+    def post(self, body):
+        response = self.client.post(self.GRAPHQL_URL, json.dumps(body), content_type='application/json')
+        return response.status_code, json.loads(response.content)
+
+    def test_responses_follow_the_operations(self):
+        status, body = self.post([
+            {'query': 'query { allProducts { totalCount } }'},
+            {'query': self.customer_query, 'variables': {'id': self.customers[1].pk}},
+            {'query': 'query { hello }'},
+        ])
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            [list(response['data']) for response in body],
+            [['allProducts'], ['customerById'], ['hello']],
+        )
+        self.assertEqual(body[1]['data']['customerById']['email'], 'customer1@example.com')
+
+    def test_operations_share_loads(self):
+        operation = {'query': self.customer_query, 'variables': {'id': self.customers[0].pk}}
+        with CaptureQueriesContext(connection) as single:
+            self.post(operation)
+        with CaptureQueriesContext(connection) as batched:
+            status, body = self.post([operation, operation])
+        self.assertEqual(status, 200)
+        self.assertEqual(body[0], body[1])
+        self.assertEqual(len(batched), len(single))
+
+    def test_fragments_share_loads_with_inline_selections(self):
+        inline = {'query': self.customer_query, 'variables': {'id': self.customers[0].pk}}
+        spread = {
+            'query': '''
+                query ($id: Int!) { customerById(id: $id) { ...CustomerOrders } }
+                fragment CustomerOrders on CustomerType {
+                    email orders { items { quantity product { name stock } } }
+                }
+            ''',
+            'variables': {'id': self.customers[0].pk},
+        }
+        with CaptureQueriesContext(connection) as single:
+            self.post(inline)
+        with CaptureQueriesContext(connection) as batched:
+            status, body = self.post([inline, spread])
+        self.assertEqual(status, 200)
+        self.assertEqual(body[0], body[1])
+        self.assertEqual(len(batched), len(single))
+
+    def test_same_spread_of_different_fragments_is_loaded_again(self):
+        query = '''
+            query ($id: Int!) { customerById(id: $id) { ...CustomerFields } }
+            fragment CustomerFields on CustomerType { %s }
+        '''
+        emails = {'query': query % 'email', 'variables': {'id': self.customers[0].pk}}
+        names = {'query': query % 'name phone', 'variables': {'id': self.customers[0].pk}}
+        with CaptureQueriesContext(connection) as batched:
+            status, body = self.post([emails, names])
+        self.assertEqual(status, 200)
+        self.assertEqual(body[1]['data']['customerById'], {'name': 'Customer 0', 'phone': None})
+        # one query each: the second did not reuse the first's row and
+        # fetch its deferred columns one by one
+        self.assertEqual(len(batched), 2)
+
+    def test_mutations_drop_what_was_loaded_before(self):
+        query = {'query': self.customer_query, 'variables': {'id': self.customers[0].pk}}
+        mutation = {
+            'query': '''
+                mutation ($input: OrderInput!) { createOrder(input: $input) { order { id } } }
+            ''',
+            'variables': {'input': {
+                'customerId': self.customers[0].pk,
+                'items': [{'productId': self.products[0].pk, 'quantity': 4}],
+            }},
+        }
+        status, body = self.post([query, mutation, query])
+        self.assertEqual(status, 200)
+
+        def laptop_stock(response):
+            orders = response['data']['customerById']['orders']
+            return orders[0]['items'][0]['product']['stock']
+
+        self.assertEqual(laptop_stock(body[0]), 10)
+        self.assertEqual(laptop_stock(body[2]), 6)
+        self.assertEqual(len(body[2]['data']['customerById']['orders']), 3)
+
+    def test_failed_operations_do_not_stop_the_batch(self):
+        status, body = self.post([{'query': 'query { hello }'}, {'variables': {}}])
+        self.assertEqual(status, 400)
+        self.assertEqual(body[0], {'data': {'hello': 'Hello, GraphQL!'}})
+        self.assertEqual(body[1]['errors'][0]['message'], 'Must provide query string.')
+
+    @override_settings(CRM_GRAPHQL_MAX_BATCH_SIZE=2)
+    def test_batch_size_is_limited(self):
+        status, body = self.post([{'query': 'query { hello }'}] * 3)
+        self.assertEqual(status, 400)
+        self.assertIn('exceeds the maximum of 2', body['errors'][0]['message'])
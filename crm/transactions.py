@@ -0,0 +1,46 @@
+"""
+Helpers for work deferred until the current transaction commits.
+"""
+
+from django.db import transaction
+
+
+class PendingWork:
+    """
+    Base class for on_commit callbacks that collect work while the
+    transaction runs. Subclasses implement ``run``.
+    """
+
+    ran = False
+
+    def run_once(self):
+        self.ran = True
+        self.run()
+
+    def run(self):
+        raise NotImplementedError
+
+
+def pending_on_commit(callback_class, using=None):
+    """
+    Returns the ``callback_class`` (a PendingWork) instance registered with
+    on_commit for the current transaction (or savepoint) that has not run
+    yet, registering a new one first if there is none. Work added to it
+    runs once, after the commit; a rollback discards it along with the
+    savepoint.
+
+    Must be called inside an atomic block.
+    """
+    connection = transaction.get_connection(using)
+    # None marks atomic blocks without a savepoint of their own
+    savepoint_ids = set(connection.savepoint_ids) - {None}
+    for sids, func, _ in connection.run_on_commit:
+        pending = getattr(func, '__self__', None)
+        if isinstance(pending, callback_class) and not pending.ran and sids - {None} == savepoint_ids:
+            return pending
+
+    callback = callback_class()
+    # the transaction's own writes are committed by the time this runs, so a
+    # failure is logged rather than reported to its caller as if they weren't
+    transaction.on_commit(callback.run_once, using=using, robust=True)
+    return callback
@@ -0,0 +1,135 @@
+"""
+Validation rules that reject expensive operations before they execute.
+
+Every selected field costs 1, and the cost of a list field's selection is
+multiplied by how many items it can return: the ``first`` argument (or the
+server page size limit) for connections, and ``CRM_GRAPHQL_LIST_SIZE`` for
+plain lists. Operations deeper than ``CRM_GRAPHQL_MAX_DEPTH`` or costlier
+than ``CRM_GRAPHQL_MAX_COST`` are rejected.
+
+Limits are computed from the document alone, so that the result can be
+cached with it: a ``first`` passed as a variable counts as the page size limit.
+Measuring stops one level past the depth limit, which also keeps fragment
+cycles (reported by the standard rules) from recursing forever.
+"""
+
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FragmentDefinitionNode,
+    GraphQLError,
+    GraphQLList,
+    IntValueNode,
+    get_named_type,
+    get_nullable_type,
+)
+from graphql.validation import ValidationRule
+
+from .optimizer import iter_field_nodes
+
+
+# how deep operations are measured when no depth limit is configured
+MAX_MEASURED_DEPTH = 100
+
+
+def _is_connection(graphql_type):
+    fields = getattr(graphql_type, 'fields', {})
+    return 'edges' in fields and 'pageInfo' in fields
+
+
+def _page_size(field_node):
+    max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+    for argument in field_node.arguments or ():
+        if argument.name.value == 'first' and isinstance(argument.value, IntValueNode):
+            return max(0, min(int(argument.value.value), max_limit))
+    return max_limit
+
+
+class QueryComplexityRule(ValidationRule):
+    """
+    Rejects operations exceeding the configured depth or cost budget.
+    """
+
+    def enter_operation_definition(self, node, *_args):
+        schema = self.context.schema
+        root_type = schema.get_root_type(node.operation)
+        if root_type is None:
+            return
+
+        fragments = {
+            definition.name.value: definition
+            for definition in self.context.document.definitions
+            if isinstance(definition, FragmentDefinitionNode)
+        }
+        max_depth = getattr(settings, 'CRM_GRAPHQL_MAX_DEPTH', None)
+        depth_budget = (max_depth if max_depth is not None else MAX_MEASURED_DEPTH) + 1
+        cost, depth = self.measure(root_type, node.selection_set, fragments, depth_budget)
+
+        if max_depth is not None and depth > max_depth:
+            self.report_error(GraphQLError(
+                f"Query depth of {depth} exceeds the maximum of {max_depth}.", node
+            ))
+
+        max_cost = getattr(settings, 'CRM_GRAPHQL_MAX_COST', None)
+        if max_cost is not None and cost > max_cost:
+            self.report_error(GraphQLError(
+                f"Query cost of {cost} exceeds the maximum of {max_cost}.", node
+            ))
+
+    def measure(self, graphql_type, selection_set, fragments, depth_budget):
+        """
+        Returns ``(cost, depth)`` of ``selection_set`` on ``graphql_type``,
+        looking at most ``depth_budget`` levels down.
+        """
+        fields = getattr(graphql_type, 'fields', None)
+        if not fields or selection_set is None or depth_budget <= 0:
+            return 0, 0
+
+        list_size = getattr(settings, 'CRM_GRAPHQL_LIST_SIZE', 20)
+        connection = _is_connection(graphql_type)
+
+        total_cost = 0
+        max_depth = 0
+        for field_node in iter_field_nodes(selection_set, fragments):
+            name = field_node.name.value
+            field = fields.get(name)
+            if name.startswith('__') or field is None:
+                continue
+
+            field_type = get_named_type(field.type)
+            if connection and name == 'edges':
+                # the page size was already applied to the connection field
+                cost, depth = self.measure_edges(field_type, field_node.selection_set, fragments, depth_budget)
+                total_cost += cost
+                max_depth = max(max_depth, depth)
+                continue
+
+            child_cost, child_depth = self.measure(
+                field_type, field_node.selection_set, fragments, depth_budget - 1
+            )
+            if _is_connection(field_type):
+                multiplier = _page_size(field_node)
+            elif isinstance(get_nullable_type(field.type), GraphQLList):
+                multiplier = list_size
+            else:
+                multiplier = 1
+
+            total_cost += 1 + multiplier * child_cost
+            max_depth = max(max_depth, 1 + child_depth)
+        return total_cost, max_depth
+
+    def measure_edges(self, edge_type, selection_set, fragments, depth_budget):
+        """
+        Measures ``edges { cursor node { ... } }`` without counting the
+        ``edges`` and ``node`` levels themselves.
+        """
+        total_cost = 0
+        max_depth = 0
+        for field_node in iter_field_nodes(selection_set, fragments):
+            if field_node.name.value != 'node':
+                continue
+            node_type = get_named_type(edge_type.fields['node'].type)
+            cost, depth = self.measure(node_type, field_node.selection_set, fragments, depth_budget)
+            total_cost += cost
+            max_depth = max(max_depth, depth)
+        return total_cost, max_depth
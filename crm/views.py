@@ -1,3 +1,439 @@
-from django.shortcuts import render
+import json
+import time
+from inspect import isawaitable
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, JsonResponse
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, HttpError, set_rollback
+from graphql import (
+    ExecutionResult,
+    GraphQLError,
+    OperationType,
+    execute,
+    get_operation_ast,
+    parse,
+    specified_rules,
+    validate,
+    validate_schema,
+)
+
+from .cache import get_or_execute, response_cache_key
+from .documents import document_cache, query_hash, resolve_persisted_query
+from .loaders import AsyncLoaders, clear_loaders
+from .metrics import QueryCounter, count_queries_async, metrics
+from .middleware import ResolverProfile
+from .routers import read_alias, route_reads, stick_to_primary
+from .validation import QueryComplexityRule
+
+
+class CRMGraphQLView(GraphQLView):
+    """
+    GraphQLView that reuses parsed and validated documents across requests,
+    understands automatic persisted queries and serves cacheable queries
+    from the response cache.
+
+    A JSON array of operations is executed as a batch: one after the other,
+    sharing the request and so its loaders, with the responses returned as
+    an array in the same order.
+    """
+
+    validation_rules = (*specified_rules, QueryComplexityRule)
+
+    def dispatch(self, request, *args, **kwargs):
+        return stick_to_primary(request, super().dispatch(request, *args, **kwargs))
+
+    @staticmethod
+    def get_extensions(request, data):
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if extensions and isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        return extensions
+
+    def get_document(self, query):
+        """
+        Returns ``(document, errors)`` for ``query``, parsing and validating
+        it only the first time it is seen.
+        """
+        key = (id(self.schema), self.validation_rules and tuple(self.validation_rules), query_hash(query))
+        entry = document_cache.get(key)
+        if entry is not None:
+            return entry
+
+        try:
+            document = parse(query)
+        except GraphQLError as e:
+            # syntax errors are cheap to rediscover and not worth caching
+            return None, [e]
+
+        errors = validate(
+            self.schema.graphql_schema,
+            document,
+            self.validation_rules,
+            graphene_settings.MAX_VALIDATION_ERRORS,
+        )
+        entry = (document, errors)
+        document_cache.set(key, entry)
+        return entry
+
+    def parse_body(self, request):
+        if self.get_content_type(request) != "application/json":
+            return super().parse_body(request)
+
+        try:
+            data = json.loads(request.body.decode("utf-8"))
+        except (UnicodeDecodeError, ValueError):
+            raise HttpError(HttpResponseBadRequest("POST body sent invalid JSON."))
+
+        if isinstance(data, list):
+            max_size = getattr(settings, 'CRM_GRAPHQL_MAX_BATCH_SIZE', 10)
+            if not data or not all(isinstance(entry, dict) for entry in data):
+                raise HttpError(HttpResponseBadRequest("Batch requests must be a non-empty list of operations."))
+            if len(data) > max_size:
+                raise HttpError(HttpResponseBadRequest(
+                    f"Batch of {len(data)} operations exceeds the maximum of {max_size}."
+                ))
+        elif not isinstance(data, dict):
+            raise HttpError(HttpResponseBadRequest("The received data is not a valid JSON query."))
+        return data
+
+    def get_batch_response(self, request, batch):
+        """
+        Returns the JSON array of responses to the operations in ``batch``
+        and the highest of their status codes.
+        """
+        responses = []
+        status_code = 200
+        for data in batch:
+            setattr(request, MUTATION_ERRORS_FLAG, False)
+            try:
+                response, status = self.get_response(request, data)
+            except HttpError as e:
+                response = self.json_encode(request, {"errors": [self.format_error(e)]})
+                status = e.response.status_code
+            responses.append(response)
+            status_code = max(status_code, status)
+        return "[{}]".format(",".join(responses)), status_code
+
+    def get_response(self, request, data, show_graphiql=False):
+        if isinstance(data, list):
+            return self.get_batch_response(request, data)
+
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        if not execution_result:
+            return None, 200
+
+        if execution_result.errors:
+            set_rollback()
+        response, status_code = self.format_execution_result(execution_result)
+        if self.batch:
+            response["id"] = id
+            response["status"] = status_code
+
+        return self.json_encode(request, response, pretty=show_graphiql), status_code
+
+    def format_execution_result(self, execution_result):
+        """
+        Returns the response body and status code for ``execution_result``,
+        as GraphQLView builds them, plus its ``extensions`` when it has any.
+        """
+        status_code = 200
+        response = {}
+        if execution_result.errors:
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+
+        if execution_result.errors and any(
+            not getattr(e, "path", None) for e in execution_result.errors
+        ):
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+
+        if execution_result.extensions:
+            response["extensions"] = execution_result.extensions
+        return response, status_code
+
+    def record_operation(self, request, result, operation_ast, operation_name, started, queries):
+        """
+        Adds an executed operation to crm.metrics, and its resolver profile
+        to the response in DEBUG mode.
+        """
+        profile = getattr(request, 'crm_profile', None)
+        resolvers = profile.as_dict() if profile is not None else None
+        metrics.record(
+            _operation_label(operation_ast, operation_name),
+            time.perf_counter() - started,
+            queries.count,
+            bool(result.errors),
+            resolvers,
+        )
+        if resolvers is not None and settings.DEBUG:
+            result.extensions = {**(result.extensions or {}), 'resolvers': resolvers}
+
+    def prepare_request(self, request, data, query, operation_name, show_graphiql=False):
+        """
+        Resolves persisted queries and looks up the validated document.
+
+        Returns ``(document, operation_ast, result)``; when ``document`` is
+        None the request ends early with ``result``.
+        """
+        try:
+            query = resolve_persisted_query(query, self.get_extensions(request, data))
+        except GraphQLError as e:
+            return None, None, ExecutionResult(errors=[e])
+
+        if not query:
+            if show_graphiql:
+                return None, None, None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return None, None, ExecutionResult(data=None, errors=schema_validation_errors)
+
+        document, validation_errors = self.get_document(query)
+        if document is None:
+            return None, None, ExecutionResult(errors=validation_errors)
+
+        operation_ast = get_operation_ast(document, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None, None, None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        if validation_errors:
+            return None, None, ExecutionResult(data=None, errors=validation_errors)
+
+        return document, operation_ast, None
+
+    def get_execute_options(self, request, variables, operation_name):
+        execute_options = {
+            "root_value": self.get_root_value(request),
+            "context_value": self.get_context(request),
+            "variable_values": variables,
+            "operation_name": operation_name,
+            "middleware": self.get_middleware(request),
+        }
+        if self.execution_context_class:
+            execute_options["execution_context_class"] = self.execution_context_class
+        return execute_options
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        started = time.perf_counter()
+        queries = QueryCounter()
+        request.crm_profile = ResolverProfile.sample()
+        with connection.execute_wrapper(queries):
+            document, operation_ast, result = self.prepare_request(
+                request, data, query, operation_name, show_graphiql
+            )
+            if document is not None:
+                try:
+                    with route_reads(request, operation_ast):
+                        result = self.execute_operation(
+                            request, document, operation_ast, query, variables, operation_name
+                        )
+                except Exception as e:
+                    result = ExecutionResult(errors=[e])
+                if operation_ast is not None and operation_ast.operation == OperationType.MUTATION:
+                    clear_loaders(request)
+
+        if result is not None:
+            self.record_operation(request, result, operation_ast, operation_name, started, queries)
+        return result
+
+    def execute_operation(self, request, document, operation_ast, query, variables, operation_name):
+        schema = self.schema.graphql_schema
+        execute_options = self.get_execute_options(request, variables, operation_name)
+
+        if (
+            operation_ast is not None
+            and operation_ast.operation == OperationType.MUTATION
+            and (
+                graphene_settings.ATOMIC_MUTATIONS is True
+                or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+            )
+        ):
+            with transaction.atomic():
+                result = execute(schema, document, **execute_options)
+                if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                    transaction.set_rollback(True)
+            return result
+
+        if operation_ast is not None and operation_ast.operation == OperationType.QUERY:
+            cache_key = response_cache_key(
+                schema, document, operation_ast, query, operation_name, variables
+            )
+            if cache_key is not None:
+                # a lagging replica can still miss writes whose invalidation
+                # already happened, so only what the primary read is stored
+                return get_or_execute(
+                    cache_key,
+                    lambda: execute(schema, document, **execute_options),
+                    store=read_alias() is None,
+                )
+
+        return execute(schema, document, **execute_options)
+
+
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """
+    CRMGraphQLView for ASGI deployments, to be used with ``async_schema``.
+
+    Query operations are executed on the event loop: their resolvers await
+    the async ORM, and independent top-level fields run concurrently.
+    Mutations run in a worker thread through the sync path. The response
+    cache, batched requests and GraphiQL are only served by the sync view.
+    """
+
+    view_is_async = True
+
+    def parse_body(self, request):
+        data = super().parse_body(request)
+        if isinstance(data, list):
+            raise HttpError(HttpResponseBadRequest("Batch requests are only accepted by /graphql."))
+        return data
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+
+            data = self.parse_body(request)
+            result, status_code = await self.get_async_response(request, data)
+            return stick_to_primary(request, HttpResponse(
+                status=status_code, content=result, content_type="application/json"
+            ))
+
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(
+                request, {"errors": [self.format_error(e)]}
+            )
+            return response
+
+    async def get_async_response(self, request, data):
+        query, variables, operation_name, _id = self.get_graphql_params(request, data)
+
+        execution_result = await self.execute_graphql_request_async(
+            request, data, query, variables, operation_name
+        )
+
+        response, status_code = self.format_execution_result(execution_result)
+        return self.json_encode(request, response), status_code
+
+    async def execute_graphql_request_async(self, request, data, query, variables, operation_name):
+        started = time.perf_counter()
+        queries = QueryCounter()
+        request.crm_profile = ResolverProfile.sample()
+        async with count_queries_async(queries):
+            document, operation_ast, result = await sync_to_async(self.prepare_request)(
+                request, data, query, operation_name
+            )
+            if document is not None:
+                try:
+                    with route_reads(request, operation_ast):
+                        result = await self.execute_operation_async(
+                            request, document, operation_ast, query, variables, operation_name
+                        )
+                except Exception as e:
+                    result = ExecutionResult(errors=[e])
+
+        self.record_operation(request, result, operation_ast, operation_name, started, queries)
+        return result
+
+    async def execute_operation_async(self, request, document, operation_ast, query, variables, operation_name):
+        if operation_ast is not None and operation_ast.operation != OperationType.QUERY:
+            return await sync_to_async(self.execute_operation)(
+                request, document, operation_ast, query, variables, operation_name
+            )
+
+        request.crm_loaders = AsyncLoaders()
+        try:
+            result = execute(
+                self.schema.graphql_schema,
+                document,
+                **self.get_execute_options(request, variables, operation_name),
+            )
+            if isawaitable(result):
+                result = await result
+        finally:
+            clear_loaders(request)
+        return result
+
+
+def _operation_label(operation_ast, operation_name):
+    if operation_ast is not None and operation_ast.name is not None:
+        return operation_ast.name.value
+    return operation_name
+
+
+def healthz(request):
+    """
+    Reports whether the database answers and the GraphQL schema is valid.
+    Responds 200 when both are fine and 503 otherwise.
+    """
+    checks = {}
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        checks['database'] = 'ok'
+    except Exception as e:
+        checks['database'] = f'error: {e}'
+
+    try:
+        # graphql-core remembers the result, so this is only costly once
+        errors = validate_schema(graphene_settings.SCHEMA.graphql_schema)
+        checks['schema'] = 'ok' if not errors else f'error: {errors[0].message}'
+    except Exception as e:
+        checks['schema'] = f'error: {e}'
+
+    healthy = all(status == 'ok' for status in checks.values())
+    return JsonResponse(
+        {'status': 'ok' if healthy else 'error', **checks, **metrics.totals()},
+        status=200 if healthy else 503,
+    )
+
+
+def metrics_view(request):
+    """
+    Returns this worker's request counts, per-operation latency histograms
+    and query counts.
+    """
+    return JsonResponse(metrics.snapshot())
@@ -1,18 +1,41 @@
 #!/usr/bin/env python
 """
 This script populates the database with sample data for testing purposes.
+
+Without arguments it creates a handful of hand-written customers, products
+and orders. Size options generate synthetic data in bulk instead, for
+capacity testing:
+
+    python seed_db.py --customers 1000000 --products 50000 --orders 3000000 --workers 8
+
+Rows are inserted with chunked bulk_create under explicit primary keys, so
+orders and their items go in without reading anything back. Every chunk
+draws from its own generator seeded from --seed, which makes the data
+identical whatever the number of workers. Building the rows is CPU bound,
+so --workers helps most on PostgreSQL; SQLite still takes one writer at a time.
 """
 
+import argparse
+import multiprocessing
 import os
 import django
 import random
+import time
 from decimal import Decimal
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
 django.setup()
 
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+
+from crm.cache import invalidate
+from crm.summaries import rebuild as rebuild_summaries
 from crm.models import Customer, Product, Order, OrderItem
 
+STATUSES = ['pending', 'delivered', 'cancelled']
+
 def create_customers():
     """Create sample customers"""
     customers_data = [
@@ -148,5 +171,164 @@ def seed_database():
     print(f"- {len(products)} products")
     print(f"- {len(orders)} orders")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Populate the CRM database with sample data.")
+    parser.add_argument('--customers', type=int, default=0, help="Synthetic customers to create.")
+    parser.add_argument('--products', type=int, default=0, help="Synthetic products to create.")
+    parser.add_argument('--orders', type=int, default=0, help="Synthetic orders to create.")
+    parser.add_argument('--items-per-order', type=int, default=3, help="Up to this many items per order.")
+    parser.add_argument('--chunk-size', type=int, default=10000, help="Rows per bulk insert and transaction.")
+    parser.add_argument('--workers', type=int, default=1, help="Processes inserting chunks in parallel.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed making the generated data reproducible.")
+    return parser.parse_args()
+
+def _rng(seed, kind, chunk):
+    return random.Random(f"{seed}:{kind}:{chunk}")
+
+def _chunks(total, chunk_size):
+    return [(index, start, min(chunk_size, total - start)) for index, start in enumerate(range(0, total, chunk_size))]
+
+def _next_pk(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+# set in every worker process by _init_worker
+_worker = {}
+
+def _init_worker(options, customer_ids, prices):
+    _worker.update(options=options, customer_ids=customer_ids, prices=prices, product_ids=sorted(prices or ()))
+
+def _insert_customers(task):
+    index, start, count = task
+    options = _worker['options']
+    first_pk = options['customer_base'] + start
+    Customer.objects.bulk_create(
+        Customer(
+            pk=pk,
+            name=f"Customer {pk}",
+            email=f"customer{pk}@example.com",
+            phone=f"+1{pk:010d}"[-15:],
+        )
+        for pk in range(first_pk, first_pk + count)
+    )
+    return count
+
+def _insert_products(task):
+    index, start, count = task
+    options = _worker['options']
+    rng = _rng(options['seed'], 'products', index)
+    first_pk = options['product_base'] + start
+    Product.objects.bulk_create(
+        Product(
+            pk=pk,
+            name=f"Product {pk}",
+            price=Decimal(rng.randint(100, 200000)) / 100,
+            stock=rng.randint(0, 1000),
+        )
+        for pk in range(first_pk, first_pk + count)
+    )
+    return count
+
+def _insert_orders(task):
+    index, start, count = task
+    options = _worker['options']
+    customer_ids = _worker['customer_ids']
+    product_ids = _worker['product_ids']
+    prices = _worker['prices']
+    rng = _rng(options['seed'], 'orders', index)
+    first_pk = options['order_base'] + start
+    
+    orders = []
+    items = []
+    for pk in range(first_pk, first_pk + count):
+        order = Order(pk=pk, customer_id=rng.choice(customer_ids), status=rng.choice(STATUSES))
+        num_products = rng.randint(1, min(options['items_per_order'], len(product_ids)))
+        for product_id in rng.sample(product_ids, num_products):
+            item = OrderItem(
+                order_id=pk, product_id=product_id, quantity=rng.randint(1, 5), unit_price=prices[product_id],
+            )
+            order.total_amount += item.unit_price * item.quantity
+            items.append(item)
+        orders.append(order)
+    
+    with transaction.atomic():
+        Order.objects.bulk_create(orders)
+        OrderItem.objects.bulk_create(items, batch_size=options['chunk_size'])
+    return count
+
+def _run(function, tasks, args, customer_ids=None, prices=None, options=None):
+    """
+    Runs ``function`` over ``tasks``, in a pool of --workers processes
+    when there is more than one, printing progress as chunks finish.
+    """
+    done = 0
+    total = sum(count for _, _, count in tasks)
+    started = time.perf_counter()
+    initargs = (options, customer_ids, prices)
+    
+    if args.workers > 1 and len(tasks) > 1:
+        # forked workers must not share the parent's connection
+        connections.close_all()
+        with multiprocessing.Pool(args.workers, initializer=_init_worker, initargs=initargs) as pool:
+            for count in pool.imap_unordered(function, tasks):
+                done += count
+                print(f"  {done}/{total} ({done / (time.perf_counter() - started):.0f} rows/s)")
+    else:
+        _init_worker(*initargs)
+        for task in tasks:
+            done += function(task)
+            print(f"  {done}/{total} ({done / (time.perf_counter() - started):.0f} rows/s)")
+
+def seed_bulk(args):
+    """Generate synthetic data in bulk"""
+    options = {
+        'seed': args.seed,
+        'chunk_size': args.chunk_size,
+        'items_per_order': args.items_per_order,
+        'customer_base': _next_pk(Customer),
+        'product_base': _next_pk(Product),
+        'order_base': _next_pk(Order),
+    }
+    started = time.perf_counter()
+    
+    if args.customers:
+        print(f"Creating {args.customers} customers...")
+        _run(_insert_customers, _chunks(args.customers, args.chunk_size), args, options=options)
+    if args.products:
+        print(f"Creating {args.products} products...")
+        _run(_insert_products, _chunks(args.products, args.chunk_size), args, options=options)
+    
+    if args.orders:
+        # orders go to the customers and products made above, or else to existing ones
+        if args.customers:
+            customer_ids = range(options['customer_base'], options['customer_base'] + args.customers)
+        else:
+            customer_ids = list(Customer.objects.values_list('pk', flat=True))
+        products = Product.objects.all()
+        if args.products:
+            products = products.filter(pk__gte=options['product_base'])
+        # items snapshot the product price, so every worker needs them
+        prices = dict(products.values_list('pk', 'price'))
+        if not customer_ids or not prices:
+            print("Cannot create orders: No customers or products available")
+        else:
+            print(f"Creating {args.orders} orders...")
+            _run(_insert_orders, _chunks(args.orders, args.chunk_size), args, customer_ids, prices, options)
+    
+    # explicit primary keys leave PostgreSQL sequences behind
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Customer, Product, Order]):
+            cursor.execute(sql)
+    # bulk_create sends no signals, so cached responses and rollups are refreshed here
+    invalidate(Customer, Product, Order, OrderItem)
+    if args.orders:
+        print("Rebuilding order summaries...")
+        rebuild_summaries()
+    
+    print(f"\nDatabase seeding completed in {time.perf_counter() - started:.1f}s")
+
 if __name__ == "__main__":
-    seed_database()
+    args = parse_args()
+    if args.customers or args.products or args.orders:
+        seed_bulk(args)
+    else:
+        seed_database()